@@ -2,42 +2,943 @@
 
 #core libraries
 import sys
+import os
 import logging
 import json
 import time
-from dateutil import tz
 import re
-from decimal import Decimal
 import base64
 import csv
 import math
-from importlib.metadata import version
+import importlib
+import threading
+import collections
+import hashlib
+import pickle
+import gzip
+import sqlite3
+import queue
+import binascii
+import zlib
+import functools
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+from importlib.metadata import version, PackageNotFoundError
 
 # installed libraries
-import browser_cookie3
 import requests
-import unicodecsv
-from unidecode import unidecode
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import datetime
-import pandas as pd
-from pandas import json_normalize
-import numpy as np
 
 #init logging
 logging.getLogger(__name__).addHandler(logging.NullHandler())
 logging.basicConfig(format="%(levelname)s: %(message)s")
 
+
+class _LazyModule(object):
+	'''
+		Defers importing a heavy dependency until one of its attributes is first used.
+		This keeps client construction fast for jobs that never touch pandas or the browser cookie store.
+	'''
+	def __init__(self, name):
+		self._name = name
+		self._module = None
+
+	def __getattr__(self, attr):
+		if self._module is None:
+			self._module = importlib.import_module(self._name)
+		return getattr(self._module, attr)
+
+
+pd = _LazyModule('pandas')
+np = _LazyModule('numpy')
+tz = _LazyModule('dateutil.tz')
+browser_cookie3 = _LazyModule('browser_cookie3')
+
+
+def json_normalize(*args, **kwargs):
+	return pd.json_normalize(*args, **kwargs)
+
+
+@functools.lru_cache(maxsize=65536)
+def _transliterate(value):
+	from unidecode import unidecode
+	return unidecode(value).replace("?","")
+
+
+def _transliterate_all(values):
+	return [_transliterate(v) for v in values]
+
+
+class EinsteinAnalyticsError(Exception):
+	'''
+		Raised by the internal helpers when an API call returns an error response.
+	'''
+	pass
+
+
+#limit on the size of the base64 encoded DataFile of an InsightsExternalDataPart
+_MAX_PART_SIZE = 10 * 1000 * 1000 - 49
+
+
+def _cache_dir():
+	base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+	return os.path.join(base, 'SalesforceEinsteinAnalytics')
+
+
+class _SessionRetry(Retry):
+	'''
+		Retry policy of the session.  Connection errors (the request never reached the server) are retried for every method.
+		Read errors and 5xx responses are only retried for idempotent methods, since a POST or PATCH that timed out may 
+		already have been processed (e.g. created an upload job or data part).  429 and 503 mean the request was turned away, 
+		so they are retried for every method.
+	'''
+	_REJECTED_STATUS = (429, 503)
+
+	def is_retry(self, method, status_code, has_retry_after=False):
+		if self.total and status_code in self._REJECTED_STATUS and self.status_forcelist and status_code in self.status_forcelist:
+			return True
+		return super(_SessionRetry, self).is_retry(method, status_code, has_retry_after)
+
+
+class _RateLimiter(object):
+	'''
+		Spaces out calls across threads so that no more than rate calls start per second (None = no limit).
+	'''
+	def __init__(self, rate=None):
+		self.interval = 1.0/rate if rate else 0
+		self._next = 0
+		self._lock = threading.Lock()
+
+	def wait(self):
+		if self.interval == 0:
+			return
+		with self._lock:
+			now = time.monotonic()
+			start = max(self._next, now)
+			self._next = start + self.interval
+		if start > now:
+			time.sleep(start - now)
+
+
+class _PartBuffer(object):
+	'''
+		Reusable byte buffer that the CSV of a data part is written into.  It only grows, so once it has held one 
+		full part the following parts are written in place without reallocating.  With compress=True everything 
+		written is gzipped on the way in and each part becomes a complete gzip member.
+	'''
+	def __init__(self, compress=False):
+		self.data = bytearray()
+		self.size = 0
+		self.raw_size = 0
+		self.compress = compress
+		#room kept free for the final deflate block and the gzip trailer
+		self.reserve = 64 if compress else 0
+		self._z = None
+
+	def clear(self):
+		self.size = 0
+		self.raw_size = 0
+		if self.compress == True:
+			self._z = zlib.compressobj(6, zlib.DEFLATED, 31)
+
+	def write(self, b):
+		self.raw_size += len(b)
+		if self.compress == True:
+			b = self._z.compress(b)
+		self.data[self.size:self.size+len(b)] = b
+		self.size += len(b)
+
+	def mark(self):
+		return self.size, self.raw_size, self._z.copy() if self.compress == True else None
+
+	def rollback(self, mark):
+		self.size, self.raw_size, z = mark
+		if self.compress == True:
+			self._z = z
+
+	def sync(self):
+		#flushes pending compressed output so that size is exact
+		if self.compress == True:
+			self._append(self._z.flush(zlib.Z_SYNC_FLUSH))
+
+	def finish(self):
+		if self.compress == True:
+			self._append(self._z.flush())
+
+	def _append(self, b):
+		self.data[self.size:self.size+len(b)] = b
+		self.size += len(b)
+
+	def view(self):
+		return memoryview(self.data)[:self.size]
+
+
+class _ChunkWriter(object):
+	'''
+		Appends dataframe chunks to a CSV file, or to a Parquet file when the path ends in .parquet/.pq.
+		Every chunk is aligned to the columns of the first chunk.
+	'''
+	def __init__(self, path):
+		self.path = path
+		self.parquet = path.lower().endswith(('.parquet', '.pq'))
+		self.columns = None
+		self._writer = None
+
+	def write(self, df):
+		if self.columns is None:
+			self.columns = list(df.columns)
+		else:
+			df = df.reindex(columns=self.columns)
+
+		if self.parquet == True:
+			import pyarrow as pa
+			import pyarrow.parquet as pq
+			if self._writer is None:
+				table = pa.Table.from_pandas(df, preserve_index=False)
+				self._writer = pq.ParquetWriter(self.path, table.schema)
+			else:
+				table = pa.Table.from_pandas(df, schema=self._writer.schema, preserve_index=False)
+			self._writer.write_table(table)
+		else:
+			first = self._writer is None
+			df.to_csv(self.path, mode='w' if first else 'a', header=first, index=False)
+			self._writer = True
+
+	def close(self):
+		if self.parquet == True and self._writer is not None:
+			self._writer.close()
+
+
+class _QueryResultCache(object):
+	'''
+		LRU cache of SAQL results keyed on the resolved query text.  Resolved queries load "datasetId/versionId" so
+		an entry is only valid for those dataset versions.  Entries for older versions are dropped as soon as a newer
+		version is seen.  Results are held in memory up to max_bytes and, if path is set, pickled to that directory
+		up to max_disk_bytes.
+	'''
+	_VERSION_REF = re.compile(r'"(\w+)/(\w+)"')
+
+	def __init__(self, max_bytes=256*1024*1024, path=None, max_disk_bytes=1024*1024*1024):
+		self.max_bytes = max_bytes
+		self.path = path
+		self.max_disk_bytes = max_disk_bytes
+		self._entries = collections.OrderedDict()
+		self._bytes = 0
+		self._lock = threading.Lock()
+		self._index = {}
+		if path is not None:
+			os.makedirs(path, exist_ok=True)
+			try:
+				with open(os.path.join(path, 'index.json'), 'r') as f:
+					self._index = json.load(f)
+			except (OSError, ValueError):
+				self._index = {}
+
+	def key(self, saql):
+		normalized = '\n'.join(l.strip() for l in saql.strip().splitlines() if l.strip() != '')
+		return hashlib.sha256(normalized.encode('utf-8')).hexdigest()
+
+	def versions(self, saql):
+		return dict(self._VERSION_REF.findall(saql))
+
+	def get(self, key):
+		with self._lock:
+			entry = self._entries.get(key)
+			if entry is not None:
+				self._entries.move_to_end(key)
+				return entry[0].copy()
+			if key not in self._index:
+				return None
+			file_path = os.path.join(self.path, key+'.pkl')
+			try:
+				with open(file_path, 'rb') as f:
+					df = pickle.load(f)
+				os.utime(file_path)
+			except (OSError, pickle.UnpicklingError, EOFError):
+				self._index.pop(key, None)
+				return None
+			self._add(key, df, self._index[key]['datasets'])
+			return df.copy()
+
+	def set(self, key, df, datasets):
+		with self._lock:
+			self._add(key, df.copy(), datasets)
+			if self.path is not None:
+				file_path = os.path.join(self.path, key+'.pkl')
+				with open(file_path, 'wb') as f:
+					pickle.dump(df, f, protocol=pickle.HIGHEST_PROTOCOL)
+				self._index[key] = {'datasets': datasets, 'size': os.path.getsize(file_path)}
+				self._evict_disk()
+				self._save_index()
+
+	def invalidate_versions(self, dsid, dsvid):
+		'''
+			Drops every result that loads dsid at a version other than dsvid.
+		'''
+		with self._lock:
+			for key in [k for k, v in self._entries.items() if v[2].get(dsid, dsvid) != dsvid]:
+				self._drop(key)
+			stale = [k for k, v in self._index.items() if v['datasets'].get(dsid, dsvid) != dsvid]
+			for key in stale:
+				self._remove_file(key)
+			if len(stale) > 0:
+				self._save_index()
+
+	def clear(self):
+		with self._lock:
+			self._entries.clear()
+			self._bytes = 0
+			for key in list(self._index):
+				self._remove_file(key)
+			self._save_index()
+
+	def _add(self, key, df, datasets):
+		if key in self._entries:
+			self._drop(key)
+		nbytes = int(df.memory_usage(index=True, deep=True).sum())
+		if nbytes > self.max_bytes:
+			return
+		self._entries[key] = (df, nbytes, datasets)
+		self._bytes += nbytes
+		while self._bytes > self.max_bytes:
+			self._drop(next(iter(self._entries)))
+
+	def _drop(self, key):
+		entry = self._entries.pop(key)
+		self._bytes -= entry[1]
+
+	def _remove_file(self, key):
+		self._index.pop(key, None)
+		try:
+			os.remove(os.path.join(self.path, key+'.pkl'))
+		except OSError:
+			pass
+
+	def _evict_disk(self):
+		total = sum(v['size'] for v in self._index.values())
+		if total <= self.max_disk_bytes:
+			return
+		def last_used(key):
+			try:
+				return os.path.getmtime(os.path.join(self.path, key+'.pkl'))
+			except OSError:
+				return 0
+		for key in sorted(self._index, key=last_used):
+			if total <= self.max_disk_bytes:
+				break
+			total -= self._index[key]['size']
+			self._remove_file(key)
+
+	def _save_index(self):
+		tmp_path = os.path.join(self.path, 'index.json.tmp')
+		with open(tmp_path, 'w') as f:
+			json.dump(self._index, f)
+		os.replace(tmp_path, os.path.join(self.path, 'index.json'))
+
+
+class _DatasetCache(object):
+	'''
+		Thread safe LRU cache for dataset lookups keyed by (org, search_type, name).
+		Entries expire after ttl seconds (None = never).  If path is set the cache is also written to a JSON file
+		so that short lived jobs can share lookups.
+	'''
+	def __init__(self, ttl=300, maxsize=256, path=None):
+		self.ttl = ttl
+		self.maxsize = maxsize
+		self.path = path
+		self._entries = collections.OrderedDict()
+		self._lock = threading.Lock()
+		if path is not None:
+			self._load()
+
+	def _expired(self, entry):
+		return self.ttl is not None and time.time() - entry[1] > self.ttl
+
+	def get(self, key):
+		with self._lock:
+			entry = self._entries.get(key)
+			if entry is None:
+				return None
+			if self._expired(entry):
+				del self._entries[key]
+				return None
+			self._entries.move_to_end(key)
+			return entry[0]
+
+	def set(self, key, value):
+		with self._lock:
+			self._entries[key] = (tuple(value), time.time())
+			self._entries.move_to_end(key)
+			while len(self._entries) > self.maxsize:
+				self._entries.popitem(last=False)
+			self._save()
+
+	def invalidate(self, org, name=None, search_type=None):
+		'''
+			Removes entries for an org.  name matches either the searched name or the dataset ID.
+		'''
+		with self._lock:
+			for key in list(self._entries):
+				value = self._entries[key][0]
+				if key[0] != org:
+					continue
+				if name is not None and name not in (key[2], value[1]):
+					continue
+				if search_type is not None and key[1] != search_type:
+					continue
+				del self._entries[key]
+			self._save()
+
+	def _load(self):
+		try:
+			with open(self.path, 'r') as f:
+				entries = json.load(f)['entries']
+		except (OSError, ValueError, KeyError):
+			return
+		for key, value, ts in entries:
+			entry = (tuple(value), ts)
+			if not self._expired(entry):
+				self._entries[tuple(key)] = entry
+		while len(self._entries) > self.maxsize:
+			self._entries.popitem(last=False)
+
+	def _save(self):
+		if self.path is None:
+			return
+		entries = [[list(k), list(v[0]), v[1]] for k, v in self._entries.items()]
+		try:
+			os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+			tmp_path = self.path+'.tmp'
+			with open(tmp_path, 'w') as f:
+				json.dump({'entries': entries}, f)
+			os.replace(tmp_path, self.path)
+		except OSError as e:
+			logging.debug('Could not write dataset cache: {}'.format(e))
+
+
+class UploadJob(object):
+	'''
+		Handle for an external data upload, returned by load_df_to_EA, load_iter_to_EA and load_file_to_EA.
+		job_id is the InsightsExternalData ID.  timings holds the seconds spent in each phase: prep (cleaning the data 
+		and building the XMD), encode (CSV, gzip and base64) and upload (data part requests), with encode and upload 
+		summed over the workers, and processing (server side, filled in by wait).  Jobs from the async client are waited on
+		with await job.wait().
+	'''
+	def __init__(self, client, job_id=None):
+		self.client = client
+		self.job_id = job_id
+		self.parts = 0
+		self.status = None
+		self.processing_started = None
+		self.timings = {'prep': 0.0, 'encode': 0.0, 'upload': 0.0, 'processing': None}
+		self._lock = threading.Lock()
+
+	def add_time(self, phase, seconds):
+		with self._lock:
+			self.timings[phase] += seconds
+
+	def wait(self, timeout=3600, poll_interval=2, poll_backoff=1.5, max_poll_interval=60, verbose=False):
+		return self.client.wait_for_completion(self, timeout=timeout, poll_interval=poll_interval, poll_backoff=poll_backoff, 
+			max_poll_interval=max_poll_interval, verbose=verbose)
+
+	def __str__(self):
+		return str(self.job_id)
+
+	def __repr__(self):
+		return 'UploadJob('+str(self.job_id)+')'
+
+
+class LineageIndex(object):
+	'''
+		In-memory dashboard/dataset lineage built from the output of get_dashboard_dataset_usage.  Datasets and dashboards can be 
+		looked up by ID or API name, apps by ID.  The lookups return sorted lists of IDs, and usage_for_datasets returns the 
+		usage rows of one or more datasets for impact analysis.
+	'''
+	def __init__(self, usage):
+		self.usage = usage.reset_index(drop=True)
+		self._rows = {}
+		for kind, column in (('dataset', 'Dataset_ID'), ('dashboard', 'Dashboard_ID'), ('app', 'App_ID')):
+			for key, positions in self.usage.groupby(column, sort=False).indices.items():
+				self._rows[(kind, key)] = positions
+		self._ids = {
+			'dataset': dict(zip(self.usage['Dataset_APIName'], self.usage['Dataset_ID'])),
+			'dashboard': dict(zip(self.usage['Dashboard_APIName'], self.usage['Dashboard_ID']))
+		}
+
+	def _positions(self, kind, key):
+		key = self._ids.get(kind, {}).get(key, key)
+		return self._rows.get((kind, key), [])
+
+	def _values(self, kind, key, column):
+		return sorted(set(self.usage[column].values[self._positions(kind, key)]))
+
+	def dashboards_for_dataset(self, dataset):
+		return self._values('dataset', dataset, 'Dashboard_ID')
+
+	def datasets_for_dashboard(self, dashboard):
+		return self._values('dashboard', dashboard, 'Dataset_ID')
+
+	def dashboards_in_app(self, app_id):
+		return self._values('app', app_id, 'Dashboard_ID')
+
+	def datasets_in_app(self, app_id):
+		return self._values('app', app_id, 'Dataset_ID')
+
+	def usage_for_datasets(self, datasets):
+		if isinstance(datasets, str):
+			datasets = [datasets]
+		positions = [p for d in datasets for p in self._positions('dataset', d)]
+		return self.usage.iloc[sorted(set(positions))]
+
+
+class MetadataStore(object):
+	'''
+		Local SQLite snapshot of the apps, app sharing and asset metadata of an org, created by metadata_store().
+		sync() lists each asset type org wide sorted by LastModified and stops paging at the first record older than the
+		previous sync, so that only new and changed records are downloaded.  getMetaData, getAssetCounts, get_app_user_list
+		and get_dashboard_dataset_usage take the same arguments as the client methods but are answered from the snapshot.
+	'''
+	_SCHEMA = '''
+		CREATE TABLE IF NOT EXISTS assets (id TEXT PRIMARY KEY, object TEXT NOT NULL, folder_id TEXT, folder_label TEXT,
+			last_modified TEXT, record TEXT NOT NULL);
+		CREATE INDEX IF NOT EXISTS assets_object_folder ON assets (object, folder_id);
+		CREATE INDEX IF NOT EXISTS assets_folder ON assets (folder_id);
+		CREATE TABLE IF NOT EXISTS shares (folder_id TEXT NOT NULL, user_id TEXT, user_name TEXT, access_type TEXT, user_type TEXT);
+		CREATE INDEX IF NOT EXISTS shares_folder ON shares (folder_id);
+		CREATE TABLE IF NOT EXISTS sync_state (object TEXT PRIMARY KEY, last_modified TEXT, synced_at REAL);
+	'''
+	_MAX_VARIABLES = 500
+
+	def __init__(self, client, path, objectList=['dashboards','lenses','datasets']):
+		self.client = client
+		self.path = path
+		self.objectList = list(objectList)
+		if path != ':memory:':
+			os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+		self._conn = sqlite3.connect(path, check_same_thread=False)
+		self._lock = threading.Lock()
+		with self._lock, self._conn:
+			self._conn.executescript(self._SCHEMA)
+
+	def close(self):
+		with self._lock:
+			self._conn.close()
+
+	def last_synced(self):
+		'''
+			Returns a dict of object type -> time of its last sync (None if it was never synced).
+		'''
+		with self._lock:
+			synced = dict(self._conn.execute('SELECT object, synced_at FROM sync_state').fetchall())
+		return {obj: datetime.datetime.fromtimestamp(synced[obj]) if obj in synced else None for obj in ['folders'] + self.objectList}
+
+	def sync(self, full=False, max_workers=None, verbose=False):
+		'''
+			Brings the snapshot up to date and returns a dict with the number of new or changed records of each type.
+			1) A type is crawled in full on its first sync, when full=True, when the API does not return it newest first, or when the
+			total reported by the API no longer matches the snapshot (deleted assets).
+			2) Sharing is refreshed for apps that are new or changed since the last sync.  full=True refreshes it for every app.
+		'''
+		if verbose == True:
+			start = time.time()
+			print('Syncing metadata snapshot '+str(self.path)+'...')
+
+		objects = ['folders'] + self.objectList
+		outcomes = self.client._run_concurrent(lambda obj: self._sync_object(obj, full), objects, max_workers=max_workers, 
+			error_message='Could not sync {}')
+		changed = {obj: ids for obj, (ids, error, latency) in zip(objects, outcomes)}
+		if verbose == True:
+			for obj, ids in changed.items():
+				if ids is not None:
+					print(obj+': '+str(len(ids))+' new or changed')
+
+		if changed['folders'] is not None:
+			with self._lock:
+				folder_ids = [row[0] for row in self._conn.execute("SELECT id FROM assets WHERE object = 'folders'")]
+			self._sync_shares(folder_ids if full == True else changed['folders'], max_workers)
+
+		if verbose == True:
+			print('Completed in '+str(round(time.time()-start,3))+'sec')
+		return {obj: len(ids) if ids is not None else None for obj, ids in changed.items()}
+
+	def _sync_object(self, obj, full=False):
+		'''
+			Stores the new and changed records of one type and returns the IDs of the records that differ from the snapshot.
+		'''
+		with self._lock:
+			state = self._conn.execute('SELECT last_modified FROM sync_state WHERE object = ?', (obj,)).fetchone()
+		watermark = state[0] if state is not None and full == False else None
+		records, total = self._changed_records(obj, watermark)
+
+		rows = []
+		for record in records:
+			folder = record.get('folder') or {}
+			if obj == 'folders':
+				folder = {'id': record['id'], 'label': record.get('label')}
+			rows.append((record['id'], obj, folder.get('id'), folder.get('label'), record.get('lastModifiedDate'), json.dumps(record)))
+		previous = dict(self._select('SELECT id, record FROM assets WHERE {}', 'id', [row[0] for row in rows]))
+
+		with self._lock, self._conn:
+			if watermark is None:
+				self._conn.execute('DELETE FROM assets WHERE object = ?', (obj,))
+			self._conn.executemany('INSERT OR REPLACE INTO assets VALUES (?, ?, ?, ?, ?, ?)', rows)
+			stored = self._conn.execute('SELECT COUNT(*), MAX(last_modified) FROM assets WHERE object = ?', (obj,)).fetchone()
+			if watermark is not None and total is not None and stored[0] != total:
+				logging.info('{} in snapshot ({}) differ from the org ({}), crawling all {}'.format(obj, stored[0], total, obj))
+			else:
+				self._conn.execute('INSERT OR REPLACE INTO sync_state VALUES (?, ?, ?)', (obj, stored[1], time.time()))
+				return [row[0] for row in rows if previous.get(row[0]) != row[5]]
+		return self._sync_object(obj, True)
+
+	def _changed_records(self, obj, watermark=None):
+		'''
+			Lists obj sorted by LastModified and returns (records, totalSize).  With a watermark paging stops at the first record
+			older than it, as long as every page seen so far came back newest first.
+		'''
+		params = {'pageSize': 200, 'sort': 'LastModified'}
+		if obj != 'folders':
+			params['hasCurrentOnly'] = 'true'
+		response = self.client._get_json('/services/data/v46.0/wave/'+obj, params=params)
+		total = response.get('totalSize')
+		records = []
+		newest_first = True
+		previous = None
+		while True:
+			page = response[obj]
+			dates = [r.get('lastModifiedDate') or '' for r in page]
+			if any(a < b for a, b in zip(dates, dates[1:])) or (previous is not None and len(dates) > 0 and previous < dates[0]):
+				newest_first = False
+			for record, modified in zip(page, dates):
+				if watermark is not None and newest_first == True and modified < watermark:
+					return records, total
+				records.append(record)
+			if len(dates) > 0:
+				previous = dates[-1]
+			next_page = response.get('nextPageUrl')
+			if next_page is None:
+				return records, total
+			response = self.client._get_json(next_page)
+
+	def _sync_shares(self, folder_ids, max_workers=None):
+		def get_shares(app):
+			response = self.client._get_json('/services/data/v46.0/wave/folders/'+app)
+			return [(app, u['sharedWithId'], u['sharedWithLabel'], u['accessType'], u['shareType']) for u in response.get('shares', [])]
+
+		outcomes = self.client._run_concurrent(get_shares, folder_ids, max_workers=max_workers, error_message='Could not get access details for app {}')
+		shares = {app: rows for app, (rows, error, latency) in zip(folder_ids, outcomes) if error is None}
+
+		with self._lock, self._conn:
+			self._conn.executemany('DELETE FROM shares WHERE folder_id = ?', [(app,) for app in shares])
+			self._conn.executemany('INSERT INTO shares VALUES (?, ?, ?, ?, ?)', [row for rows in shares.values() for row in rows])
+			self._conn.execute("DELETE FROM shares WHERE folder_id NOT IN (SELECT id FROM assets WHERE object = 'folders')")
+
+	def _select(self, sql, column, values, params=()):
+		'''
+			Runs sql with "{}" replaced by "column IN (...)", splitting values to stay under the SQLite variable limit.
+			values=None drops the filter.
+		'''
+		with self._lock:
+			if values is None:
+				return self._conn.execute(sql.format('1 = 1'), params).fetchall()
+			values = list(values)
+			rows = []
+			for i in range(0, len(values), self._MAX_VARIABLES):
+				chunk = values[i:i+self._MAX_VARIABLES]
+				rows.extend(self._conn.execute(sql.format(column+' IN ('+','.join('?'*len(chunk))+')'), tuple(params)+tuple(chunk)).fetchall())
+			return rows
+
+	def _check_synced(self, objects):
+		with self._lock:
+			synced = set(row[0] for row in self._conn.execute('SELECT object FROM sync_state'))
+		missing = [obj for obj in objects if obj not in synced]
+		if len(missing) > 0:
+			logging.warning('The metadata snapshot has not been synced for: '+', '.join(missing))
+
+	def getMetaData(self, appIdList=None, objectList=['dashboards','lenses','datasets'], verbose=False):
+		'''
+			Returns the same dataframe as salesforceEinsteinAnalytics.getMetaData from the snapshot.  appIdList=None returns every app.
+		'''
+		self._check_synced(objectList)
+		rows = []
+		for obj in objectList:
+			rows.extend(self._select('SELECT record FROM assets WHERE object = ? AND {} ORDER BY folder_id, last_modified DESC', 'folder_id', appIdList, (obj,)))
+		assets_df = json_normalize([json.loads(row[0]) for row in rows])
+		return self.client._parse_asset_dates(assets_df)
+
+	def getAssetCounts(self, appIdList=None, countsToReturn=['dashboards','lenses','datasets'], verbose=False):
+		'''
+			Returns the asset counts per app from the snapshot, in the format of getAssetCounts(countOnly=True).
+		'''
+		self._check_synced(['folders'] + list(countsToReturn))
+		singular = {'dashboards': 'dashboard', 'lenses': 'lens', 'datasets': 'dataset'}
+		if appIdList is None:
+			apps = self._select("SELECT id, folder_label FROM assets WHERE object = 'folders' AND {} ORDER BY folder_label", 'id', None)
+		else:
+			labels = dict(self._select("SELECT id, folder_label FROM assets WHERE object = 'folders' AND {}", 'id', appIdList))
+			apps = [(a, labels.get(a)) for a in appIdList]
+		rows = {a: {'folder.id': a, 'folder.label': label} for a, label in apps}
+		for a in rows:
+			rows[a].update({singular.get(obj, obj): 0 for obj in countsToReturn})
+		counts = self._select('SELECT folder_id, folder_label, object, COUNT(*) FROM assets WHERE object IN ('+','.join('?'*len(countsToReturn))+') AND {} GROUP BY folder_id, object',
+			'folder_id', appIdList, tuple(countsToReturn))
+		for a, label, obj, n in counts:
+			if a not in rows:
+				rows[a] = {'folder.id': a, 'folder.label': label}
+				rows[a].update({singular.get(o, o): 0 for o in countsToReturn})
+			rows[a][singular.get(obj, obj)] = n
+			if rows[a]['folder.label'] is None:
+				rows[a]['folder.label'] = label
+
+		columns = sorted(singular.get(obj, obj) for obj in countsToReturn)
+		df = pd.DataFrame(list(rows.values()), columns=['folder.id', 'folder.label'] + columns)
+		df = df.rename(columns={'dashboard': 'dashboardCount', 'dataset': 'datasetCount', 'lens': 'lensCount'})
+		df.columns.names = ['index']
+		return df
+
+	def get_app_user_list(self, app_id=None, save_path=None, verbose=False):
+		'''
+			Returns the same dataframe as salesforceEinsteinAnalytics.get_app_user_list from the snapshot.
+		'''
+		self._check_synced(['folders'])
+		rows = self._select('''SELECT s.folder_id, a.folder_label, s.user_id, s.user_name, s.access_type, s.user_type FROM shares s
+			JOIN assets a ON a.id = s.folder_id AND a.object = 'folders' WHERE {} ORDER BY a.folder_label, s.rowid''', 's.folder_id', app_id)
+		app_user_df = pd.DataFrame(rows, columns=['AppId', 'AppName', 'UserId', 'UserName', 'AccessType', 'UserType'])
+		if save_path is not None:
+			app_user_df.to_csv(save_path, index=False)
+		return app_user_df
+
+	def get_dashboard_dataset_usage(self, appIdList=None, verbose=False):
+		'''
+			Returns the same dataframe as salesforceEinsteinAnalytics.get_dashboard_dataset_usage from the snapshot.
+		'''
+		return self.client._dashboard_dataset_rows(self.getMetaData(appIdList=appIdList, objectList=['dashboards']))
+
+
+class DashboardBackupStore(object):
+	'''
+		Local backups of dashboard definitions and version histories, created by dashboard_backup_store(path).
+		The JSON of each definition and history version is stored once per distinct content, gzipped under objects/ and named 
+		by its SHA-256, so backing up a dashboard that has not changed writes nothing.  index.sqlite records which content 
+		each dashboard had at each backup and its history versions, for restore by (dashboard, timestamp).
+	'''
+	_SCHEMA = '''
+		CREATE TABLE IF NOT EXISTS dashboards (dashboard_id TEXT PRIMARY KEY, label TEXT, last_modified TEXT, blob TEXT, backed_up_at REAL);
+		CREATE TABLE IF NOT EXISTS snapshots (dashboard_id TEXT NOT NULL, backed_up_at REAL NOT NULL, last_modified TEXT, blob TEXT NOT NULL);
+		CREATE INDEX IF NOT EXISTS snapshots_dashboard ON snapshots (dashboard_id, backed_up_at);
+		CREATE TABLE IF NOT EXISTS versions (dashboard_id TEXT NOT NULL, history_id TEXT NOT NULL, label TEXT, created_date TEXT,
+			created_by TEXT, revert_url TEXT, blob TEXT, PRIMARY KEY (dashboard_id, history_id));
+		CREATE INDEX IF NOT EXISTS versions_dashboard ON versions (dashboard_id, created_date);
+	'''
+
+	def __init__(self, client, path):
+		self.client = client
+		self.path = path
+		os.makedirs(os.path.join(path, 'objects'), exist_ok=True)
+		self._conn = sqlite3.connect(os.path.join(path, 'index.sqlite'), check_same_thread=False)
+		self._lock = threading.Lock()
+		with self._lock, self._conn:
+			self._conn.executescript(self._SCHEMA)
+
+	def close(self):
+		with self._lock:
+			self._conn.close()
+
+	def _blob_path(self, blob):
+		return os.path.join(self.path, 'objects', blob[:2], blob[2:]+'.json.gz')
+
+	def _put(self, obj):
+		'''
+			Stores obj as canonical JSON and returns (hash, written).  Content that is already stored is not written again.
+		'''
+		data = json.dumps(obj, sort_keys=True, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+		blob = hashlib.sha256(data).hexdigest()
+		path = self._blob_path(blob)
+		if os.path.exists(path):
+			return blob, False
+		os.makedirs(os.path.dirname(path), exist_ok=True)
+		tmp_path = path+'.'+str(threading.get_ident())+'.tmp'
+		with open(tmp_path, 'wb') as f:
+			f.write(gzip.compress(data, 6))
+		os.replace(tmp_path, path)
+		return blob, True
+
+	def _get(self, blob):
+		with open(self._blob_path(blob), 'rb') as f:
+			return json.loads(gzip.decompress(f.read()).decode('utf-8'))
+
+	def _timestamp(self, timestamp):
+		'''
+			Returns timestamp (None = now) in the UTC format of the API dates, so it can be compared with createdDate.
+		'''
+		ts = pd.Timestamp.now(tz='UTC') if timestamp is None else pd.to_datetime(timestamp, utc=True)
+		return ts.strftime('%Y-%m-%dT%H:%M:%S.')+'%03dZ' % (ts.microsecond//1000)
+
+	def backup(self, appIdList=None, full=False, max_workers=None, rate_limit=None, verbose=False):
+		'''
+			Backs up the dashboards in the apps in appIdList (every dashboard the user can see if None).
+			The definition and /histories of each dashboard are fetched concurrently (max_workers defaults to the pool size, 
+			rate_limit caps the dashboards started per second) and only history versions that are not in the index yet are
+			downloaded.  Dashboards whose lastModifiedDate is unchanged since the last backup are skipped unless full=True.
+			Returns a dataframe with a row per dashboard: Dashboard_ID, status (backed up, unchanged or error), new_versions, 
+			blobs_written and message.
+		'''
+		if verbose == True:
+			start = time.time()
+			print('Backing up dashboards to '+str(self.path)+'...')
+
+		if appIdList is None:
+			dashboards = self.client._list_assets(None, 'dashboards')
+		else:
+			dashboards = [d for app in appIdList for d in self.client._list_assets(app, 'dashboards')]
+		with self._lock:
+			last_modified = dict(self._conn.execute('SELECT dashboard_id, last_modified FROM dashboards').fetchall())
+			known = collections.defaultdict(set)
+			for dashboard_id, history_id in self._conn.execute('SELECT dashboard_id, history_id FROM versions'):
+				known[dashboard_id].add(history_id)
+
+		def fetch(dashboard):
+			dashboard_id = dashboard['id']
+			definition = self.client._get_json('/services/data/v46.0/wave/dashboards/'+dashboard_id)
+			histories = self.client._get_json('/services/data/v46.0/wave/dashboards/'+dashboard_id+'/histories')['histories']
+			blob, written = self._put(definition)
+			blobs_written = int(written)
+			versions = []
+			for h in histories:
+				if h['id'] in known[dashboard_id]:
+					continue
+				version_blob = None
+				if h.get('previewUrl') is not None:
+					version_blob, written = self._put(self.client._get_json(h['previewUrl']))
+					blobs_written += int(written)
+				versions.append((dashboard_id, h['id'], h.get('label'), h.get('createdDate'), (h.get('createdBy') or {}).get('name'), h.get('revertUrl'), version_blob))
+			return definition, blob, versions, blobs_written
+
+		todo = [d for d in dashboards if full == True or last_modified.get(d['id']) != d.get('lastModifiedDate')]
+		rows = {d['id']: {'Dashboard_ID': d['id'], 'status': 'unchanged', 'new_versions': 0, 'blobs_written': 0} for d in dashboards}
+		backed_up_at = time.time()
+		outcomes = self.client._run_concurrent(fetch, todo, max_workers=max_workers, rate_limit=rate_limit, 
+			error_message='Could not back up dashboard {0[id]}', verbose=verbose)
+		for dashboard, (fetched, error, latency) in zip(todo, outcomes):
+			if error is not None:
+				rows[dashboard['id']].update({'status': 'error', 'message': str(error)})
+				continue
+			definition, blob, versions, blobs_written = fetched
+			self._record(dashboard, definition, blob, versions, backed_up_at)
+			rows[dashboard['id']].update({'status': 'backed up', 'new_versions': len(versions), 'blobs_written': blobs_written})
+
+		results = pd.DataFrame(list(rows.values()), columns=['Dashboard_ID', 'status', 'new_versions', 'blobs_written', 'message'])
+		if verbose == True:
+			end = time.time()
+			print('\n'+str((results['status'] == 'backed up').sum())+' backed up, '+str((results['status'] == 'unchanged').sum())+' unchanged, '+
+				str((results['status'] == 'error').sum())+' failed, '+str(results['blobs_written'].sum())+' files written')
+			print('Completed in '+str(round(end-start,3))+'sec')
+		return results
+
+	def _record(self, dashboard, definition, blob, versions, backed_up_at):
+		with self._lock, self._conn:
+			previous = self._conn.execute('SELECT blob FROM dashboards WHERE dashboard_id = ?', (dashboard['id'],)).fetchone()
+			if previous is None or previous[0] != blob:
+				self._conn.execute('INSERT INTO snapshots VALUES (?, ?, ?, ?)', (dashboard['id'], backed_up_at, dashboard.get('lastModifiedDate'), blob))
+			self._conn.execute('INSERT OR REPLACE INTO dashboards VALUES (?, ?, ?, ?, ?)', 
+				(dashboard['id'], definition.get('label'), dashboard.get('lastModifiedDate'), blob, backed_up_at))
+			self._conn.executemany('INSERT OR REPLACE INTO versions VALUES (?, ?, ?, ?, ?, ?, ?)', versions)
+
+	def list_versions(self, dashboard_id=None):
+		'''
+			Returns a dataframe of the backed up history versions, newest first, for one dashboard or all of them.
+		'''
+		sql = 'SELECT dashboard_id, history_id, label, created_date, created_by, revert_url, blob FROM versions'
+		with self._lock:
+			if dashboard_id is None:
+				rows = self._conn.execute(sql+' ORDER BY dashboard_id, created_date DESC').fetchall()
+			else:
+				rows = self._conn.execute(sql+' WHERE dashboard_id = ? ORDER BY created_date DESC', (dashboard_id,)).fetchall()
+		return pd.DataFrame(rows, columns=['Dashboard_ID', 'History_ID', 'Label', 'CreatedDate', 'CreatedBy', 'RevertUrl', 'Blob'])
+
+	def version_at(self, dashboard_id, timestamp=None):
+		'''
+			Returns the row of list_versions for the version of the dashboard that was current at timestamp (None = latest),
+			or None if no version that old has been backed up.
+		'''
+		with self._lock:
+			row = self._conn.execute('''SELECT dashboard_id, history_id, label, created_date, created_by, revert_url, blob FROM versions
+				WHERE dashboard_id = ? AND created_date <= ? ORDER BY created_date DESC LIMIT 1''', (dashboard_id, self._timestamp(timestamp))).fetchone()
+		if row is None:
+			return None
+		return dict(zip(['Dashboard_ID', 'History_ID', 'Label', 'CreatedDate', 'CreatedBy', 'RevertUrl', 'Blob'], row))
+
+	def get_json(self, dashboard_id, timestamp=None):
+		'''
+			Returns the backed up JSON of the dashboard version that was current at timestamp (None = latest).
+		'''
+		version = self.version_at(dashboard_id, timestamp)
+		if version is not None and version['Blob'] is not None:
+			return self._get(version['Blob'])
+		with self._lock:
+			row = self._conn.execute('SELECT blob FROM snapshots WHERE dashboard_id = ? AND backed_up_at <= ? ORDER BY backed_up_at DESC LIMIT 1',
+				(dashboard_id, time.time() if timestamp is None else pd.to_datetime(timestamp, utc=True).timestamp())).fetchone()
+		if row is None:
+			raise EinsteinAnalyticsError('No backup of dashboard '+dashboard_id+' at '+self._timestamp(timestamp))
+		return self._get(row[0])
+
+	def restore(self, dashboard_id, timestamp=None, verbose=False):
+		'''
+			Reverts the dashboard to the version that was current at timestamp (a datetime or date string, None = latest backup)
+			by sending its historyId to the version's revertUrl, as restore_previous_dashboard_version does.  If the org no
+			longer has that history version, the backed up state is PATCHed onto the dashboard instead.
+			Raises EinsteinAnalyticsError if there is no backed up version at timestamp or the dashboard can't be restored.
+		'''
+		version = self.version_at(dashboard_id, timestamp)
+		if version is None:
+			raise EinsteinAnalyticsError('No backed up version of dashboard '+dashboard_id+' at '+self._timestamp(timestamp))
+
+		if version['RevertUrl'] is not None:
+			r = self.client._request('PUT', version['RevertUrl'], data=json.dumps({'historyId': version['History_ID']}))
+			if r.ok == True:
+				if verbose == True:
+					print('Restored dashboard '+dashboard_id+' to version '+str(version['History_ID'])+' ('+str(version['CreatedDate'])+')')
+				return r.json()
+			logging.debug(r.text)
+
+		if version['Blob'] is None:
+			raise EinsteinAnalyticsError('Could not restore dashboard '+dashboard_id+': the revert failed and the version JSON was not backed up')
+		state = self._get(version['Blob'])
+		payload = {k: state[k] for k in ('label', 'description', 'state', 'mobileDisabled') if k in state}
+		r = self.client._request('PATCH', '/services/data/v46.0/wave/dashboards/'+dashboard_id, data=json.dumps(payload))
+		if r.ok == False:
+			raise EinsteinAnalyticsError('Could not restore dashboard '+dashboard_id+': '+r.text)
+		if verbose == True:
+			print('Restored dashboard '+dashboard_id+' from the backup of version '+str(version['History_ID'])+' ('+str(version['CreatedDate'])+')')
+		return r.json()
+
+
 class salesforceEinsteinAnalytics(object):
-	def __init__(self, env_url, browser, rawcookie=None, cookiefile=None, logLevel='WARN'):
+	def __init__(self, env_url, browser, rawcookie=None, cookiefile=None, logLevel='WARN', pool_size=10, max_retries=3, backoff_factor=0.5, timeout=300, check_version=False,
+		dataset_cache_ttl=300, dataset_cache_size=256, dataset_cache_path=None, query_cache_size=0, query_cache_path=None, query_cache_disk_size=1024*1024*1024):
+		'''
+			pool_size sets the number of keep-alive connections held open to the org and the default number of concurrent requests.
+			max_retries and backoff_factor control how connection errors, 429 and 5xx responses are retried for every request.
+			timeout is the default number of seconds to wait on a request.
+			The max_request_attempts arguments on individual methods are kept for backwards compatibility, retries are handled by the session.
+			check_version=True looks for a newer release on PyPI (see check_for_updates).
+			dataset_cache_* control the cache of dataset name -> ID/version lookups.  Set dataset_cache_path to keep it on disk.
+			query_cache_size (bytes in memory) and/or query_cache_path (directory) turn on the SAQL result cache.
+		'''
 		self.setLogLvl(level=logLevel)
 		self.env_url = env_url
+		self.timeout = timeout
+		self.max_workers = pool_size
+		self.session = self.create_session(pool_size=pool_size, max_retries=max_retries, backoff_factor=backoff_factor)
+		self.dataset_cache = _DatasetCache(ttl=dataset_cache_ttl, maxsize=dataset_cache_size, path=dataset_cache_path)
+		if query_cache_size > 0 or query_cache_path is not None:
+			self.query_cache = _QueryResultCache(max_bytes=query_cache_size, path=query_cache_path, max_disk_bytes=query_cache_disk_size)
+		else:
+			self.query_cache = None
 		
-		#Check if package is current version
-		response = requests.get('https://pypi.org/pypi/SalesforceEinsteinAnalytics/json')
-		latest_version = response.json()['info']['version']
-		curr_version = version("SalesforceEinsteinAnalytics")
-		if curr_version != latest_version:
-			logging.info('New version available. Use "pip install SalesforceEinsteinAnalytics --upgrade" to upgrade.')
+		#Check if package is current version (opt-in so construction never blocks on the network)
+		if check_version == True:
+			self.check_for_updates()
 		
 		#get browser cookie to use in request header
 		if rawcookie != None:
@@ -76,6 +977,79 @@ class salesforceEinsteinAnalytics(object):
 				logging.error('ERROR: Could not get session ID.  Make sure you are logged into a live Salesforce session (chrome/firefox).')
 				sys.exit(1)
 
+		self.session.headers.update(self.header)
+
+
+	def check_for_updates(self, timeout=2, cache_ttl=86400):
+		'''
+			Logs a message if a newer release is available on PyPI.
+			The result is cached on disk for cache_ttl seconds and any network or cache error is ignored.
+		'''
+		cache_file = os.path.join(_cache_dir(), 'version_check.json')
+		latest_version = None
+		try:
+			with open(cache_file, 'r') as f:
+				cached = json.load(f)
+			if time.time() - cached['checked'] < cache_ttl:
+				latest_version = cached['latest_version']
+		except (OSError, ValueError, KeyError):
+			pass
+
+		if latest_version is None:
+			try:
+				response = requests.get('https://pypi.org/pypi/SalesforceEinsteinAnalytics/json', timeout=timeout)
+				latest_version = response.json()['info']['version']
+			except Exception as e:
+				logging.debug('Version check failed: {}'.format(e))
+				return None
+			try:
+				os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+				with open(cache_file, 'w') as f:
+					json.dump({'checked': time.time(), 'latest_version': latest_version}, f)
+			except OSError as e:
+				logging.debug('Could not cache version check: {}'.format(e))
+
+		try:
+			curr_version = version("SalesforceEinsteinAnalytics")
+		except PackageNotFoundError:
+			return latest_version
+		if curr_version != latest_version:
+			logging.info('New version available. Use "pip install SalesforceEinsteinAnalytics --upgrade" to upgrade.')
+		return latest_version
+
+
+	def create_session(self, pool_size=10, max_retries=3, backoff_factor=0.5):
+		'''
+			Builds the pooled session used for all API calls (see _SessionRetry for the retry policy).
+			Retries use exponential backoff and respect the Retry-After header.
+		'''
+		retry = _SessionRetry(
+			total=max_retries,
+			connect=max_retries,
+			read=max_retries,
+			status=max_retries,
+			backoff_factor=backoff_factor,
+			status_forcelist=(429, 500, 502, 503, 504),
+			allowed_methods=frozenset(['GET', 'HEAD', 'PUT', 'DELETE']),
+			respect_retry_after_header=True,
+			raise_on_status=False
+		)
+		adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+		session = requests.Session()
+		session.mount('https://', adapter)
+		session.mount('http://', adapter)
+		return session
+
+
+	def _request(self, method, url, **kwargs):
+		'''
+			Sends a request through the shared session.  Urls starting with "/" are joined to env_url.
+		'''
+		if url.startswith('/'):
+			url = self.env_url+url
+		kwargs.setdefault('timeout', self.timeout)
+		return self.session.request(method, url, **kwargs)
+
 
 	def setLogLvl(self, level='WARN'):
 		if level == 'DEBUG':
@@ -99,98 +1073,177 @@ class salesforceEinsteinAnalytics(object):
 			return curr_time.strftime("%I:%M:%S %p")	
 
 
-	def get_dataset_id(self, dataset_name, search_type='API Name', verbose=False):
+	def get_dataset_id(self, dataset_name, search_type='API Name', verbose=False, use_cache=True):
+		'''
+			Returns the API name, dataset ID and current version ID for a dataset.
+			Results are cached (see dataset_cache_ttl), use_cache=False forces a new lookup.
+		'''
+		key = (self.env_url, search_type, dataset_name)
+		if use_cache == True:
+			cached = self.dataset_cache.get(key)
+			if cached is not None:
+				if verbose == True:
+					print('Using cached dataset ID for '+dataset_name+'.')
+				return cached
 
-		if search_type=='API Name':
-			try:
-				params = {'pageSize': 50, 'sort': 'Mru', 'hasCurrentOnly': 'true', 'q': dataset_name}
-				dataset_json = requests.get(self.env_url+'/services/data/v54.0/wave/datasets', headers=self.header, params=params) 
-				dataset_df = json_normalize(json.loads(dataset_json.text)['datasets'])
-			except:
-				logging.error('ERROR: dataset not found using API Name search. Change search type to ID. Details in documentation.')
-				sys.exit(1)	
-		elif search_type=='ID':
-			try:
-				params = {'pageSize': 50, 'sort': 'Mru', 'hasCurrentOnly': 'true', 'ids': [dataset_name]}
-				dataset_json = requests.get(self.env_url+'/services/data/v54.0/wave/datasets', headers=self.header, params=params) 
-				dataset_df = json_normalize(json.loads(dataset_json.text)['datasets'])
-			except:
-				logging.error('ERROR: dataset not found using ID Name search. Change search type and ensure you have access to the dataset.')
-				sys.exit(1)
-		else:
+		if search_type not in ('API Name', 'ID', 'UI Label'):
 			logging.error('ERROR: select an available search_type: API Name, ID, or UI Label')
 			sys.exit(1)
 
-		#check if the user wants to seach by API name or label name
 		try:
-			if search_type == 'UI Label':
-				dataset_df = dataset_df[dataset_df['label'] == dataset_name]
-			elif search_type == 'ID':
-				dataset_df = dataset_df[dataset_df['id'] == dataset_name]
+			matches = self._search_datasets([dataset_name], search_type)[dataset_name]
+		except Exception:
+			if search_type == 'ID':
+				logging.error('ERROR: dataset not found using ID Name search. Change search type and ensure you have access to the dataset.')
 			else:
-				dataset_df = dataset_df[dataset_df['name'] == dataset_name]
-		except:
-			logging.error('Dataset search for {} failed to return a result.  Ensure you have access to the dataset and review the Troubleshooting section in the documentation'.format(dataset_name))
+				logging.error('ERROR: dataset not found using API Name search. Change search type to ID. Details in documentation.')
 			sys.exit(1)
 
 		#show user how many matches that they got.  Might want to use exact API name if getting multiple matches for label search.
 		if verbose == True:
-			print('Found '+str(dataset_df.shape[0])+' matching datasets.')
+			print('Found '+str(len(matches))+' matching datasets.')
 
-		#if dataframe is empty then return not found message or return the dataset ID
-		if dataset_df.empty == True:
+		#if there are no matches then return not found message or return the dataset ID
+		if len(matches) == 0:
 			logging.error('Dataset search for {} failed to return a result.  Ensure you have access to the dataset and review the Troubleshooting section in the documentation'.format(dataset_name))
 			sys.exit(1)
-		else:
-			dsnm = dataset_df['name'].tolist()[0]
-			dsid = dataset_df['id'].tolist()[0]
-			
+		
+		return self._cache_dataset(key, matches[0])
+
+
+	def resolve_datasets(self, dataset_names, search_type='API Name', use_cache=True, max_workers=None, verbose=False):
+		'''
+			Resolves many datasets at once and returns a dictionary of {dataset_name: (dsnm, dsid, dsvid)}.
+			Cached names are not requested again, ID searches are batched into a single request and
+			name searches run in parallel (max_workers defaults to the pool size).
+			Datasets that can't be found are logged and left out of the result.
+		'''
+		resolved = {}
+		to_lookup = []
+		for n in dict.fromkeys(dataset_names):
+			cached = self.dataset_cache.get((self.env_url, search_type, n)) if use_cache == True else None
+			if cached is not None:
+				resolved[n] = cached
+			else:
+				to_lookup.append(n)
+
+		def lookup(names):
+			try:
+				matches = self._search_datasets(names, search_type)
+				return [(n, self._cache_dataset((self.env_url, search_type, n), matches[n][0]) if len(matches[n]) > 0 else None) for n in names]
+			except Exception as e:
+				logging.debug('Dataset search for {} failed: {}'.format(', '.join(names), e))
+				return [(n, None) for n in names]
+
+		from_cache = len(resolved)
+		if len(to_lookup) > 0:
+			if search_type == 'ID':
+				results = lookup(to_lookup)
+			else:
+				with ThreadPoolExecutor(max_workers=min(max_workers or self.max_workers, len(to_lookup))) as pool:
+					results = [r for batch in pool.map(lookup, [[n] for n in to_lookup]) for r in batch]
+			for n, ds in results:
+				if ds is not None:
+					resolved[n] = ds
+				else:
+					logging.warning('Dataset search for {} failed to return a result.'.format(n))
+
+		if verbose == True:
+			print('Resolved '+str(len(resolved))+' datasets ('+str(from_cache)+' from cache).')
+		return resolved
+
+
+	def invalidate_dataset_cache(self, dataset_name=None, search_type=None):
+		'''
+			Drops cached dataset lookups for this org.  With no arguments the whole cache for the org is cleared.
+			dataset_name can be the searched name or the dataset ID.
+		'''
+		self.dataset_cache.invalidate(self.env_url, name=dataset_name, search_type=search_type)
+
+
+	def _search_datasets(self, dataset_names, search_type):
+		'''
+			Returns {dataset_name: [matching dataset json]}.  ID searches are sent in batches of 100 IDs per request.
+		'''
+		matches = {}
+		batches = [dataset_names[i:i+100] for i in range(0, len(dataset_names), 100)] if search_type == 'ID' else [[n] for n in dataset_names]
+		for batch in batches:
+			params, field = self._dataset_search_params(batch, search_type)
+			r = self._request('GET', '/services/data/v54.0/wave/datasets', params=params)
+			r.raise_for_status()
+			datasets = r.json()['datasets']
+			for n in batch:
+				matches[n] = [d for d in datasets if d.get(field) == n]
+		return matches
+
+
+	def _dataset_search_params(self, dataset_names, search_type):
+		'''
+			Returns the query parameters for a dataset search and the field that has to match the searched name.
+		'''
+		if search_type == 'ID':
+			return {'pageSize': 200, 'sort': 'Mru', 'hasCurrentOnly': 'true', 'ids': ','.join(dataset_names)}, 'id'
+		field = 'label' if search_type == 'UI Label' else 'name'
+		return {'pageSize': 50, 'sort': 'Mru', 'hasCurrentOnly': 'true', 'q': dataset_names[0]}, field
+
+
+	def _cache_dataset(self, key, dataset):
+		dsvid = dataset.get('currentVersionId')
+		if dsvid is None:
 			#get dataset version ID
-			r = requests.get(self.env_url+'/services/data/v46.0/wave/datasets/'+dsid, headers=self.header)
+			r = self._request('GET', '/services/data/v46.0/wave/datasets/'+dataset['id'])
 			dsvid = json.loads(r.text)['currentVersionId']
-			
-			return dsnm, dsid, dsvid 
+		return self._store_dataset(key, dataset['name'], dataset['id'], dsvid)
+
 
+	def _store_dataset(self, key, dsnm, dsid, dsvid):
+		self.dataset_cache.set(key, (dsnm, dsid, dsvid))
+		if self.query_cache is not None:
+			self.query_cache.invalidate_versions(dsid, dsvid)
+		if key[1] != 'ID':
+			self.dataset_cache.set((self.env_url, 'ID', dsid), (dsnm, dsid, dsvid))
+		return dsnm, dsid, dsvid
 
-	def run_saql_query(self, saql, dataset_search_type='API Name', search_for_dataset=True, save_path=None, verbose=False):
+
+	def run_saql_query(self, saql, dataset_search_type='API Name', search_for_dataset=True, save_path=None, chunk_size=None, use_cache=True, verbose=False):
 		'''
 			This function takes a saql query as an argument and returns a dataframe or saves to csv
 			The query can be in JSON form or can be in the UI SAQL form
 			load statements must have the appropreate spaces: =_load_\"datasetname\";
+			If chunk_size is set the results are paged with offset/limit (see run_saql_query_iter).  Combined with
+			save_path the pages are written straight to the file (.csv or .parquet) and nothing is returned.
+			When the result cache is on, queries that load explicit dataset versions are answered from the cache if possible.
 		'''
 
+		if chunk_size is not None:
+			chunks = self.run_saql_query_iter(saql, chunk_size=chunk_size, dataset_search_type=dataset_search_type, 
+				search_for_dataset=search_for_dataset, save_path=save_path, verbose=verbose)
+			if save_path is not None:
+				for chunk in chunks:
+					pass
+				return None
+			return pd.concat(list(chunks), ignore_index=True)
+
 		if verbose == True:
 			start = time.time()
 			print('Checking SAQL and Finding Dataset IDs...')
 			print('Process started at: '+str(self.get_local_time()))
 		
-		saql = saql.replace('\"','\\"') #convert UI saql query to JSON format
-		
-		if search_for_dataset == True:
-			#create a dictionary with all datasets used in the query
-			load_stmt_old = re.findall(r"(= load )(.*?)(;)", saql)
-			load_stmt_new = load_stmt_old.copy()
-			for ls in range(0,len(load_stmt_new)):
-				load_stmt_old[ls] = ''.join(load_stmt_old[ls])
-
-				dsnm, dsid, dsvid = self.get_dataset_id(dataset_name=load_stmt_new[ls][1].replace('\\"',''), search_type=dataset_search_type, verbose=verbose)
-				load_stmt_new[ls] = ''.join(load_stmt_new[ls])
-				load_stmt_new[ls] = load_stmt_new[ls].replace(dsnm, dsid+'/'+dsvid)	
-
-			#update saql with dataset ID and version ID
-			for i in range(0,len(load_stmt_new)):
-				saql = saql.replace(load_stmt_old[i], load_stmt_new[i])
-		
-		saql = saql.replace('\\"','\"')
-			
-		if verbose == True:
-			print('Running SAQL Query...')
-			print(saql)
-
-		#run query and return dataframe or save as csv
-		payload = {"query":saql}
-		r = requests.post(self.env_url+'/services/data/v46.0/wave/query', headers=self.header, data=json.dumps(payload) )
-		df = json_normalize(json.loads(r.text)['results']['records'])
+		try:
+			saql_query = saql
+			if search_for_dataset == True:
+				saql_query = self._resolve_saql(saql, dataset_search_type=dataset_search_type, verbose=verbose)
+				
+			if verbose == True:
+				print('Running SAQL Query...')
+				print(saql_query)
+
+			#run query and return dataframe or save as csv
+			df = self._execute_saql(saql, saql_query, dataset_search_type=dataset_search_type, search_for_dataset=search_for_dataset, 
+				use_cache=use_cache, verbose=verbose)
+		except EinsteinAnalyticsError as e:
+			logging.error(e)
+			sys.exit(1)
 		
 		
 		if save_path is not None:			
@@ -210,313 +1263,554 @@ class salesforceEinsteinAnalytics(object):
 			return df
 
 
-	def restore_previous_dashboard_version(self, dashboard_id, version_num=None, save_json_path=None):
+	def run_saql_query_iter(self, saql, chunk_size=10000, dataset_search_type='API Name', search_for_dataset=True, save_path=None, verbose=False):
 		'''
-			version number goes backwards 0 = current version 20 is max oldest version.
-			Typically best practice to run the function and view the history first before supplying a version number.
+			Pages through the results of a SAQL query with offset/limit and yields one dataframe per page,
+			so memory is bounded by chunk_size rather than the size of the result.
+			If save_path is given (.csv or .parquet) each page is also appended to the file as it is fetched.
+			The query should contain an order statement so that the pages are stable.
 		'''
-		#get broken dashboard version history
-		r = requests.get(self.env_url+'/services/data/v46.0/wave/dashboards/'+dashboard_id+'/histories', headers=self.header)
-		history_df = json_normalize(json.loads(r.text)['histories'])
-			
-		if save_json_path is not None and version_num is not None:
-			preview_link = history_df['previewUrl'].tolist()[version_num]
-			r_restore = requests.get(self.env_url+preview_link, headers=self.header)
-			with open(save_json_path, 'w', encoding='utf-8') as f:
-				json.dump(r_restore.json(), f, ensure_ascii=False, indent=4)
-		
-		elif version_num is not None:
-			payload = { "historyId": history_df['id'].tolist()[version_num] }
-			fix = requests.put(self.env_url+history_df['revertUrl'].tolist()[version_num], headers=self.header, data=json.dumps(payload))
-		
-		else:
-			return history_df
-		
-
-	def get_app_user_list(self, app_id=None, save_path=None, verbose=False, max_request_attempts=3):
-		
-		if verbose == True:
-			start = time.time()
-			progress_counter = 0
-			print('Getting app user list and access details...')
-			print('Process started at: '+str(self.get_local_time()))
+		if search_for_dataset == True:
+			try:
+				saql = self._resolve_saql(saql, dataset_search_type=dataset_search_type, verbose=verbose)
+			except EinsteinAnalyticsError as e:
+				logging.error(e)
+				sys.exit(1)
 
-		if app_id is None:
-			'''ALERT: CURRENTLY GETTING AN ERROR FOR ALL APP REQUEST
-				ERROR = OpenSSL.SSL.SysCallError: (-1, 'Unexpected EOF')
-				Proposed Solution is to add a try/except block to handle the error
-			'''
-			app_user_df = pd.DataFrame()
-			attempts = 0
-			while attempts < max_request_attempts:
+		try:
+			stream = self._final_stream(saql)
+		except EinsteinAnalyticsError as e:
+			logging.error(e)
+			sys.exit(1)
+		if re.search(r'\border\b', saql) is None:
+			logging.warning('SAQL query has no order statement.  Pages may overlap or skip rows.')
+		saql = saql.rstrip()
+		if saql.endswith(';') == False:
+			saql += ';'
+
+		writer = _ChunkWriter(save_path) if save_path is not None else None
+		offset = 0
+		try:
+			while True:
+				page = saql+'\n{0} = offset {0} {1};\n{0} = limit {0} {2};'.format(stream, offset, chunk_size)
 				try:
-					r = requests.get(self.env_url+'/services/data/v46.0/wave/folders', headers=self.header)
-					response = json.loads(r.text)
-					total_size = response['totalSize']
-					next_page = response['nextPageUrl']
-					break
-				except:
-					attempts += 1
-					logging.warning("Unexpected error:", sys.exc_info()[0])
-					logging.warning("Trying again...")
-
-			for app in response['folders']:
-				attempts = 0
-				while attempts < max_request_attempts:
-					try:
-						r = requests.get(self.env_url+'/services/data/v46.0/wave/folders/'+app["id"], headers=self.header)
-						users = json.loads(r.text)['shares']
-						for u in users: 
-							new_row = pd.DataFrame({"AppId": app['id'], 
-													"AppName": app['label'], 
-													"UserId": u['sharedWithId'], 
-													"UserName": u['sharedWithLabel'], 
-													"AccessType": u['accessType'], 
-													"UserType": u['shareType']
-													})
-							app_user_df = pd.concat([app_user_df,new_row], ignore_index=True)
-						break
-					except:
-						attempts += 1
-						logging.warning("Unexpected error:", sys.exc_info()[0])
-						logging.warning("Trying again...")
-
-			#continue to pull data from next page
-			attempts = 0 # reset attempts for additional pages
-			while next_page is not None:
-				progress_counter += 25
+					records = self._post_saql(page)
+				except EinsteinAnalyticsError as e:
+					logging.error(e)
+					sys.exit(1)
+				offset += len(records)
 				if verbose == True:
-					print('Progress: '+str(round(progress_counter/total_size*100,1))+'%', end='', flush=True)
-
-				while attempts < max_request_attempts:
-					try:
-						np = requests.get(self.env_url+next_page, headers=self.header)
-						response = json.loads(np.text)
-						next_page = response['nextPageUrl']
-						break
-					except KeyError:
-						next_page = None
-						logging.error(sys.exc_info()[0])
-						break
-					except:
-						attempts += 1
-						logging.warning("Unexpected error:", sys.exc_info()[0])
-						logging.warning("Trying again...")
-
-
-				while attempts < max_request_attempts:
-					try:
-						for app in response['folders']:
-							r = requests.get(self.env_url+'/services/data/v46.0/wave/folders/'+app["id"], headers=self.header)
-							users = json.loads(r.text)['shares']
-							for u in users: 
-								new_row = pd.DataFrame({"AppId": app['id'], 
-													"AppName": app['label'], 
-													"UserId": u['sharedWithId'], 
-													"UserName": u['sharedWithLabel'], 
-													"AccessType": u['accessType'], 
-													"UserType": u['shareType']
-													})
-								app_user_df = pd.concat([app_user_df,new_row], ignore_index=True)
-						break
-					except:
-						attempts += 1
-						logging.warning("Unexpected error:", sys.exc_info()[0])
-						logging.warning("Trying again...")
-
-
-		elif app_id is not None:
-			app_user_df = pd.DataFrame()
-			if type(app_id) is list or type(app_id) is tuple:
-				for app in app_id:
-					r = requests.get(self.env_url+'/services/data/v46.0/wave/folders/'+app, headers=self.header)
-					response = json.loads(r.text)
-					for u in response['shares']: 
-						new_row = pd.DataFrame({"AppId": [app], 
-												"AppName": response['label'], 
-												"UserId": u['sharedWithId'], 
-												"UserName": u['sharedWithLabel'], 
-												"AccessType": u['accessType'], 
-												"UserType": u['shareType']
-												})
-						app_user_df = pd.concat([app_user_df,new_row], ignore_index=True)
-			else:
-				logging.error('Please input a list or tuple of app Ids')
-				sys.exit(1)
-
-		
-		
-		if save_path is not None:
-			if verbose == True:
-				print('Saving result to CSV...')
-			app_user_df.to_csv(save_path, index=False)
-			if verbose == True:
-				end = time.time()
-				print('Dataframe saved to CSV...')
-				print('Completed in '+str(round(end-start,3))+'sec')
-			return app_user_df
-			
-		else: 
+					print('\rFetched '+str(offset)+' rows', end='', flush=True)
+				if len(records) > 0:
+					df = json_normalize(records)
+					if writer is not None:
+						writer.write(df)
+					yield df
+				if len(records) < chunk_size:
+					break
+		finally:
+			if writer is not None:
+				writer.close()
 			if verbose == True:
-				end = time.time()
-				print('Completed in '+str(round(end-start,3))+'sec')
-			return app_user_df
+				print('')
 
 
-	def update_app_access(self, user_dict, app_id, update_type, verbose=False):
+	def run_saql_queries(self, queries, max_workers=None, rate_limit=None, dataset_search_type='API Name', search_for_dataset=True, use_cache=True, verbose=False):
 		'''
-			update types include:  addNewUsers, fullReplaceAccess, removeUsers, updateUsers
+			Runs a batch of independent SAQL queries concurrently.
+			queries is a dictionary of {name: saql} (or a list, in which case the names are the list positions).
+			Datasets are resolved once for the whole batch.  max_workers caps the number of queries in flight
+			(defaults to the pool size) and rate_limit caps the number of queries started per second.
+			Returns (results, errors): {name: dataframe} for the queries that succeeded and {name: exception} for the ones that failed.
 		'''
+		if isinstance(queries, dict) == False:
+			queries = dict(enumerate(queries))
 
 		if verbose == True:
 			start = time.time()
-			print('Updating App Access...')
+			print('Running '+str(len(queries))+' SAQL queries...')
 			print('Process started at: '+str(self.get_local_time()))
-		
-		if update_type == 'fullReplaceAccess':
-			shares = user_dict
 
-		elif update_type == 'addNewUsers':
-			r = requests.get(self.env_url+'/services/data/v46.0/wave/folders/'+app_id, headers=self.header)
-			response = json.loads(r.text)
-			shares = response['shares']
-			
-			#remove fields in the JSON that we don't want
-			for s in shares:
-				try:
-					del s['sharedWithLabel']
-				except:
-					pass
-				try:
-					del s['imageUrl']
-				except:
-					pass
-			
-			shares = shares + user_dict
+		results = {}
+		errors = {}
+		resolved_queries = {}
+		if search_for_dataset == True:
+			dataset_names = [n for q in queries.values() for n in self._find_load_datasets(q)]
+			resolved = self.resolve_datasets(dataset_names, search_type=dataset_search_type, use_cache=use_cache, max_workers=max_workers, verbose=verbose)
+			for name, saql in queries.items():
+				missing = [n for n in self._find_load_datasets(saql) if n not in resolved]
+				if len(missing) > 0:
+					errors[name] = EinsteinAnalyticsError('Dataset search for {} failed to return a result.'.format(', '.join(missing)))
+				else:
+					resolved_queries[name] = self._rewrite_saql(saql, resolved)
+		else:
+			resolved_queries = dict(queries)
 
-		elif update_type == 'removeUsers':
-			r = requests.get(self.env_url+'/services/data/v46.0/wave/folders/'+app_id, headers=self.header)
-			response = json.loads(r.text)
-			shares = response['shares']
-			
-			to_remove = []
-			for u in user_dict:
-				to_remove.append(u['sharedWithId'])
+		def run(name):
+			return self._execute_saql(queries[name], resolved_queries[name], dataset_search_type=dataset_search_type, 
+				search_for_dataset=search_for_dataset, use_cache=use_cache)
 
-			for s in shares:
-				if s['sharedWithId'] in to_remove:
-					shares.remove(s)
+		names = list(resolved_queries)
+		outcomes = self._run_concurrent(run, names, max_workers=max_workers, rate_limit=rate_limit, error_message='Query {} failed', verbose=verbose)
+		for name, (df, error, latency) in zip(names, outcomes):
+			if error is None:
+				results[name] = df
+			else:
+				errors[name] = error
 
-			#remove fields in the JSON that we don't want
-			for s in shares:
-				try:
-					del s['sharedWithLabel']
-				except:
-					pass
-				try:
-					del s['imageUrl']
-				except:
-					pass
+		if verbose == True:
+			end = time.time()
+			print('\n'+str(len(results))+' succeeded, '+str(len(errors))+' failed')
+			print('Completed in '+str(round(end-start,3))+'sec')
+		return results, errors
 
-		elif update_type == 'updateUsers':
-			r = requests.get(self.env_url+'/services/data/v46.0/wave/folders/'+app_id, headers=self.header)
-			response = json.loads(r.text)
-			shares = response['shares']
-			
-			to_update = []
-			for u in user_dict:
-				to_update.append(u['sharedWithId'])
 
-			for s in range(0,len(shares)):
-				if shares[s]['sharedWithId'] in to_update:
-					shares[s] = next(item for item in user_dict if item["sharedWithId"] == shares[s]['sharedWithId'])
+	_SAQL_LITERAL = re.compile(r'"[^"]*"|\'[^\']*\'|--[^\n]*')
+	_SAQL_ASSIGNMENT = re.compile(r'^\s*(\w+)\s*=')
 
-			#remove fields in the JSON that we don't want
-			for s in shares:
-				try:
-					del s['sharedWithLabel']
-				except:
-					pass
-				try:
-					del s['imageUrl']
-				except:
-					pass
+	def _final_stream(self, saql):
+		'''
+			Returns the stream assigned by the last statement of a SAQL query.  Statements are split on ";" after removing
+			string literals, field names and comments (escaped quotes of the JSON form are unescaped first), so single line 
+			queries work.  Raises EinsteinAnalyticsError if the last statement is not an assignment.
+		'''
+		statements = [st for st in self._SAQL_LITERAL.sub(lambda m: '' if m.group(0).startswith('--') else '""', saql.replace('\\"', '"')).split(';') if st.strip() != '']
+		match = self._SAQL_ASSIGNMENT.match(statements[-1]) if len(statements) > 0 else None
+		if match is None:
+			raise EinsteinAnalyticsError('Could not find the final stream in the SAQL query.')
+		return match.group(1)
 
-		else:
-			shares = None
-			logging.error('Please choose a user update operation.  Options are: addNewUsers, fullReplaceAccess, removeUsers, updateUsers')
+
+	def _execute_saql(self, saql, saql_query, dataset_search_type='API Name', search_for_dataset=True, use_cache=True, verbose=False):
+		'''
+			Runs a resolved query through the result cache.  If the query fails and its datasets were looked up,
+			they are looked up again (a new version may have been published) and the query is retried once.
+			Before a cached result is used for a query whose datasets were looked up, the current version of the datasets is
+			checked with one request, since the dataset cache may be older than the latest publish.
+		'''
+		cache_key, df = self._cached_query(saql_query, use_cache)
+		if df is not None and search_for_dataset == True and self._has_new_versions(saql_query) == True:
+			saql_query = self._resolve_saql(saql, dataset_search_type=dataset_search_type, use_cache=False)
+			cache_key, df = self._cached_query(saql_query, use_cache)
+		if df is not None:
+			if verbose == True:
+				print('Using cached result...')
+			return df
+
+		try:
+			records = self._post_saql(saql_query)
+		except EinsteinAnalyticsError as e:
+			if search_for_dataset == False:
+				raise
+			logging.debug(e)
+			saql_query = self._resolve_saql(saql, dataset_search_type=dataset_search_type, use_cache=False)
+			records = self._post_saql(saql_query)
+			if cache_key is not None:
+				cache_key = self._query_cache_key(saql_query)
+		return self._cache_query_result(cache_key, saql_query, records)
+
+
+	def _cached_query(self, saql_query, use_cache=True):
+		'''
+			Returns (cache_key, cached dataframe or None) for a resolved query.  cache_key is None when the result cache is off 
+			or the query can't be cached.  Shared by the synchronous and async clients.
+		'''
+		if use_cache == False or self.query_cache is None:
+			return None, None
+		cache_key = self._query_cache_key(saql_query)
+		return cache_key, self.query_cache.get(cache_key) if cache_key is not None else None
+
+
+	def _cache_query_result(self, cache_key, saql_query, records):
+		df = json_normalize(records)
+		if cache_key is not None:
+			self.query_cache.set(cache_key, df, self.query_cache.versions(saql_query))
+		return df
+
+
+	def _has_new_versions(self, saql_query):
+		'''
+			Returns True if any dataset loaded by a resolved query has a newer current version than the one it loads.
+			If the check fails the loaded versions are assumed to be current.
+		'''
+		versions = self.query_cache.versions(saql_query)
+		try:
+			matches = self._search_datasets(list(versions), 'ID')
+		except Exception as e:
+			logging.debug('Could not check dataset versions: {}'.format(e))
+			return False
+		return self._versions_changed(saql_query, {dsid: m[0].get('currentVersionId') for dsid, m in matches.items() if len(m) > 0})
+
+
+	def _versions_changed(self, saql_query, current):
+		'''
+			Returns True if current ({dataset ID: currentVersionId}) has a different version for a dataset loaded by the query.
+		'''
+		return any(current.get(dsid, dsvid) not in (None, dsvid) for dsid, dsvid in self.query_cache.versions(saql_query).items())
+
+
+	def _query_cache_key(self, saql_query):
+		'''
+			Returns the result cache key for a query, or None if a load statement doesn't pin a dataset version.
+		'''
+		loads = self._find_load_datasets(saql_query)
+		if len(loads) == 0 or any('/' not in l for l in loads):
+			return None
+		return self.query_cache.key(saql_query)
+
+
+	def clear_query_cache(self):
+		if self.query_cache is not None:
+			self.query_cache.clear()
+
+
+	def _post_saql(self, saql_query):
+		'''
+			Runs a query that has already been resolved and returns the result records.
+		'''
+		r = self._request('POST', '/services/data/v46.0/wave/query', data=json.dumps({"query":saql_query}))
+		try:
+			return r.json()['results']['records']
+		except (ValueError, KeyError, TypeError):
+			raise EinsteinAnalyticsError('SAQL query failed ('+str(r.status_code)+'): '+r.text)
+
+
+	def _resolve_saql(self, saql, dataset_search_type='API Name', verbose=False, use_cache=True):
+		'''
+			Replaces the dataset names in the load statements with datasetId/versionId.
+			All datasets are looked up in parallel before the query is rewritten.
+		'''
+		dataset_names = self._find_load_datasets(saql)
+		resolved = self.resolve_datasets(dataset_names, search_type=dataset_search_type, use_cache=use_cache, verbose=verbose)
+		missing = [n for n in dataset_names if n not in resolved]
+		if len(missing) > 0:
+			raise EinsteinAnalyticsError('Dataset search for {} failed to return a result.  Ensure you have access to the dataset and review the Troubleshooting section in the documentation'.format(', '.join(missing)))
+		return self._rewrite_saql(saql, resolved)
+
+
+	_LOAD_STMT = re.compile(r'(=\s*load\s+)"(.*?)"(\s*;)')
+
+	def _find_load_datasets(self, saql):
+		return list(dict.fromkeys(m.group(2) for m in self._LOAD_STMT.finditer(saql)))
+
+
+	def _rewrite_saql(self, saql, resolved):
+		'''
+			Rewrites every load statement in one pass using a {dataset_name: (dsnm, dsid, dsvid)} dictionary.
+		'''
+		def replace(m):
+			dsnm, dsid, dsvid = resolved[m.group(2)]
+			return m.group(1)+'"'+dsid+'/'+dsvid+'"'+m.group(3)
+		return self._LOAD_STMT.sub(replace, saql)
+
+
+	def restore_previous_dashboard_version(self, dashboard_id, version_num=None, save_json_path=None):
+		'''
+			version number goes backwards 0 = current version 20 is max oldest version.
+			Typically best practice to run the function and view the history first before supplying a version number.
+		'''
+		#get broken dashboard version history
+		r = self._request('GET', '/services/data/v46.0/wave/dashboards/'+dashboard_id+'/histories')
+		history_df = json_normalize(json.loads(r.text)['histories'])
+			
+		if save_json_path is not None and version_num is not None:
+			preview_link = history_df['previewUrl'].tolist()[version_num]
+			r_restore = self._request('GET', preview_link)
+			with open(save_json_path, 'w', encoding='utf-8') as f:
+				json.dump(r_restore.json(), f, ensure_ascii=False, indent=4)
+		
+		elif version_num is not None:
+			payload = { "historyId": history_df['id'].tolist()[version_num] }
+			fix = self._request('PUT', history_df['revertUrl'].tolist()[version_num], data=json.dumps(payload))
+		
+		else:
+			return history_df
+
+
+	def dashboard_backup_store(self, path):
+		'''
+			Opens (or creates) a dashboard backup store in the directory path (see DashboardBackupStore).
+			Call backup() on it to back up dashboards and restore() to revert one to the version it had at a point in time.
+		'''
+		return DashboardBackupStore(self, path)
+		
+
+	def get_app_user_list(self, app_id=None, save_path=None, verbose=False, max_request_attempts=3, max_workers=None):
+		'''
+			Returns a dataframe with the users and groups that have access to each app.  If app_id (a list or tuple of app Ids)
+			is not supplied the access list for all apps is returned.  The app details are requested concurrently
+			(max_workers defaults to the pool size).
+		'''
+		
+		if verbose == True:
+			start = time.time()
+			print('Getting app user list and access details...')
+			print('Process started at: '+str(self.get_local_time()))
+
+		if app_id is None:
+			app_id = [f['id'] for f in self._list_folders()]
+		elif type(app_id) is not list and type(app_id) is not tuple:
+			logging.error('Please input a list or tuple of app Ids')
 			sys.exit(1)
+
+		def get_shares(app):
+			r = self._request('GET', '/services/data/v46.0/wave/folders/'+app)
+			r.raise_for_status()
+			response = r.json()
+			return self._share_rows(app, response['label'], response['shares'])
+
+		outcomes = self._run_concurrent(get_shares, app_id, max_workers=max_workers, error_message='Could not get access details for app {}', verbose=verbose)
+		app_user_df = pd.DataFrame([row for rows, error, latency in outcomes if error is None for row in rows], columns=['AppId', 'AppName', 'UserId', 'UserName', 'AccessType', 'UserType'])
 		
-		if shares is not None:
-			payload = {"shares": shares}
-			r = requests.patch(self.env_url+'/services/data/v46.0/wave/folders/'+app_id, headers=self.header, data=json.dumps(payload))
+		if save_path is not None:
+			if verbose == True:
+				print('\nSaving result to CSV...')
+			app_user_df.to_csv(save_path, index=False)
+			if verbose == True:
+				end = time.time()
+				print('Dataframe saved to CSV...')
+				print('Completed in '+str(round(end-start,3))+'sec')
+			return app_user_df
+			
+		else: 
+			if verbose == True:
+				end = time.time()
+				print('\nCompleted in '+str(round(end-start,3))+'sec')
+			return app_user_df
+
+
+	def _list_folders(self):
+		'''
+			Returns the json for every app (folder) the user has access to, following nextPageUrl.
+		'''
+		r = self._request('GET', '/services/data/v46.0/wave/folders', params={'pageSize': 200})
+		r.raise_for_status()
+		response = r.json()
+		folders = response['folders']
+		next_page = response.get('nextPageUrl')
+		while next_page is not None:
+			r = self._request('GET', next_page)
+			r.raise_for_status()
+			response = r.json()
+			folders.extend(response['folders'])
+			next_page = response.get('nextPageUrl')
+		return folders
+
+
+	def _share_rows(self, app_id, app_label, shares):
+		return [{"AppId": app_id, 
+				"AppName": app_label, 
+				"UserId": u['sharedWithId'], 
+				"UserName": u['sharedWithLabel'], 
+				"AccessType": u['accessType'], 
+				"UserType": u['shareType']
+				} for u in shares]
+
+
+	def update_app_access(self, user_dict, app_id, update_type, verbose=False):
+		'''
+			update types include:  addNewUsers, fullReplaceAccess, removeUsers, updateUsers
+
+			Shares are matched on sharedWithId.  addNewUsers also updates the access of users that are already in the app
+			and updateUsers ignores users that are not.  The share list is only PATCHed if it would change.
+			Returns a dict with the number of shares added, removed and changed and whether the app was patched.
+		'''
+
+		if verbose == True:
+			start = time.time()
+			print('Updating App Access...')
+			print('Process started at: '+str(self.get_local_time()))
+		
+		if update_type not in self._ACCESS_UPDATE_TYPES:
+			logging.error('Please choose a user update operation.  Options are: addNewUsers, fullReplaceAccess, removeUsers, updateUsers')
+			sys.exit(1)
+
+		try:
+			result = self._apply_app_access(user_dict, app_id, update_type)
+		except EinsteinAnalyticsError as e:
+			logging.error(str(e))
+			sys.exit(1)
 
 		if verbose == True:
 			end = time.time()
-			print('User Access Updated')
+			print('User Access Updated' if result['patched'] == True else 'No changes to make')
 			print('Completed in '+str(round(end-start,3))+'sec')
+		return result
 
 
-	def remove_non_ascii(self, df, columns=None):
-		if columns == None:
-			columns = df.columns
+	def bulk_update_app_access(self, update_df, update_type, max_workers=None, rate_limit=None, verbose=False):
+		'''
+			Applies update_type (see update_app_access) to many apps concurrently.  update_df has a row per app and user with the 
+			columns AppId, UserId, AccessType and UserType, the same as the output of get_app_user_list (AccessType and UserType 
+			are not needed for removeUsers).  With fullReplaceAccess the rows of an app are its complete new access list.
+			max_workers defaults to the pool size and rate_limit caps the number of apps started per second.
+			Returns a dataframe with a row per app: AppId, status (updated, unchanged or error), added, removed, changed, 
+			message and latency (seconds).
+		'''
+		if update_type not in self._ACCESS_UPDATE_TYPES:
+			logging.error('Please choose a user update operation.  Options are: addNewUsers, fullReplaceAccess, removeUsers, updateUsers')
+			sys.exit(1)
+		columns = ['AppId', 'UserId'] if update_type == 'removeUsers' else ['AppId', 'UserId', 'AccessType', 'UserType']
+		missing = [c for c in columns if c not in update_df.columns]
+		if len(missing) > 0:
+			logging.error('update_df is missing the columns: '+', '.join(missing))
+			sys.exit(1)
+
+		if verbose == True:
+			start = time.time()
+			print('Updating access for '+str(update_df['AppId'].nunique())+' apps...')
+			print('Process started at: '+str(self.get_local_time()))
+
+		apps = []
+		for app, group in update_df.groupby('AppId', sort=False):
+			if update_type == 'removeUsers':
+				shares = [{'sharedWithId': u} for u in group['UserId']]
+			else:
+				shares = [{'accessType': a, 'shareType': t, 'sharedWithId': u} for u, a, t in zip(group['UserId'], group['AccessType'], group['UserType'])]
+			apps.append((app, shares))
+
+		outcomes = self._run_concurrent(lambda app: self._apply_app_access(app[1], app[0], update_type), apps, max_workers=max_workers, 
+			rate_limit=rate_limit, error_message='Could not update access for app {0[0]}', verbose=verbose)
+		rows = []
+		for (app, shares), (result, error, latency) in zip(apps, outcomes):
+			if error is not None:
+				rows.append({'AppId': app, 'status': 'error', 'message': str(error), 'latency': latency})
+			else:
+				rows.append({'AppId': app, 'status': 'updated' if result['patched'] == True else 'unchanged', 'added': result['added'],
+					'removed': result['removed'], 'changed': result['changed'], 'latency': latency})
+
+		results = pd.DataFrame(rows, columns=['AppId', 'status', 'added', 'removed', 'changed', 'message', 'latency'])
+		if verbose == True:
+			end = time.time()
+			print('\n'+str((results['status'] == 'updated').sum())+' updated, '+str((results['status'] == 'unchanged').sum())+' unchanged, '+
+				str((results['status'] == 'error').sum())+' failed')
+			print('Completed in '+str(round(end-start,3))+'sec')
+		return results
+
+
+	_ACCESS_UPDATE_TYPES = ('addNewUsers', 'fullReplaceAccess', 'removeUsers', 'updateUsers')
+
+	def _apply_app_access(self, user_dict, app_id, update_type):
+		'''
+			Reads the shares of an app, applies the update keyed by sharedWithId and PATCHes the app if anything changed.
+			Returns {'added', 'removed', 'changed', 'patched'}.  Raises EinsteinAnalyticsError if a request fails.
+		'''
+		#remove fields in the JSON that we don't want
+		def payload(s):
+			return {k: v for k, v in s.items() if k not in ('sharedWithLabel', 'imageUrl')}
+		def comparable(s):
+			return sorted((k, v.lower() if isinstance(v, str) else v) for k, v in s.items())
+
+		current = {s['sharedWithId']: payload(s) for s in self._get_json('/services/data/v46.0/wave/folders/'+app_id)['shares']}
+		users = {u['sharedWithId']: payload(u) for u in user_dict}
+
+		if update_type == 'fullReplaceAccess':
+			shares = users
+		elif update_type == 'addNewUsers':
+			shares = dict(current)
+			shares.update(users)
+		elif update_type == 'removeUsers':
+			shares = {k: v for k, v in current.items() if k not in users}
+		elif update_type == 'updateUsers':
+			shares = {k: users.get(k, v) for k, v in current.items()}
 		else:
-			columns = columns
+			raise EinsteinAnalyticsError('Unknown update type: '+str(update_type))
+
+		result = {
+			'added': len(shares.keys() - current.keys()),
+			'removed': len(current.keys() - shares.keys()),
+			'changed': sum(1 for k in shares.keys() & current.keys() if comparable(shares[k]) != comparable(current[k])),
+			'patched': False
+		}
+		if result['added'] + result['removed'] + result['changed'] == 0:
+			logging.debug('Access for app '+app_id+' is already up to date')
+			return result
+
+		r = self._request('PATCH', '/services/data/v46.0/wave/folders/'+app_id, data=json.dumps({'shares': list(shares.values())}))
+		if r.ok == False:
+			raise EinsteinAnalyticsError('Could not update access for app '+app_id+': '+r.text)
+		result['patched'] = True
+		return result
+
+
+	def remove_non_ascii(self, df, columns=None, processes=None):
+		'''
+			Replaces non-ASCII characters with their closest ASCII equivalent and removes "?" in the text columns of df (in place).
+			Each distinct value is converted once and columns that are already clean are left untouched.
+			Set processes to spread columns with many distinct non-ASCII values over a process pool.
+		'''
+		if columns is None:
+			columns = df.columns
 
-		for c in columns:
-			if df[c].dtype == "O":
-				df[c] = df[c].apply(lambda x: unidecode(x).replace("?",""))
+		pool = ProcessPoolExecutor(processes) if processes is not None else None
+		try:
+			for c in columns:
+				if self._is_text(df[c]) == True:
+					column = self._ascii_column(df[c], pool=pool, processes=processes)
+					if column is not df[c]:
+						df[c] = column
+		finally:
+			if pool is not None:
+				pool.shutdown()
 
 
-	def create_xmd(self, df, dataset_label, useNumericDefaults=True, default_measure_val="0.0", default_measure_fmt="0.0#", charset="UTF-8", deliminator=",", lineterminator="\r\n"):
-		dataset_label = dataset_label
-		dataset_api_name = dataset_label.replace(" ","_")
+	def _is_text(self, column):
+		return column.dtype == "O" or isinstance(column.dtype, pd.StringDtype)
 
-		fields = []
-		for c in df.columns:
-			if df[c].dtype == "datetime64[ns]":
-				name = c.replace(" ","_")
-				name = name.replace("__","_")
-				date = {
-					"fullyQualifiedName": name,
-					"name": name,
-					"type": "Date",
-					"label": c,
-					"format": "yyyy-MM-dd HH:mm:ss"
-				}
-				fields.append(date)
-			elif np.issubdtype(df[c].dtype, np.number):
-				if useNumericDefaults == True:
-					precision = 18
-					scale = 2
-				elif useNumericDefaults == False:
-					precision = df[c].astype('str').apply(lambda x: len(x.replace('.', ''))).max()
-					scale = -df[c].astype('str').apply(lambda x: Decimal(x).as_tuple().exponent).min()
-				name = c.replace(" ","_")
-				name = name.replace("__","_")
-				measure = {
-					"fullyQualifiedName": name,
-					"name": name,
-					"type": "Numeric",
-					"label": c,
-					"precision": precision,
-					"defaultValue": default_measure_val,
-					"scale": scale,
-					"format": default_measure_fmt,
-					"decimalSeparator": "."
-				}
-				fields.append(measure)
+
+	def _ascii_column(self, column, pool=None, processes=None):
+		'''
+			Returns column with non-ASCII characters replaced and "?" removed, or column itself if nothing needs to change.
+		'''
+		codes, uniques = pd.factorize(column)
+		uniques = np.asarray(uniques, dtype=object)
+		try:
+			joined = ''.join(uniques)
+			if joined.isascii() and '?' not in joined:
+				return column
+		except TypeError:
+			#non-string values are left as they are
+			pass
+
+		converted = uniques.copy()
+		to_convert = []
+		for i, value in enumerate(uniques):
+			if isinstance(value, str):
+				if value.isascii() == True:
+					converted[i] = value.replace("?","")
+				else:
+					to_convert.append(i)
+
+		if len(to_convert) > 0:
+			values = [uniques[i] for i in to_convert]
+			if pool is not None and len(values) >= 10000:
+				size = math.ceil(len(values) / (processes * 4))
+				results = [v for chunk in pool.map(_transliterate_all, [values[i:i+size] for i in range(0, len(values), size)]) for v in chunk]
 			else:
-				name = c.replace(" ","_")
-				name = name.replace("__","_")
-				dimension = {
-					"fullyQualifiedName": name,
-					"name": name,
-					"type": "Text",
-					"label": c
-				}
-				fields.append(dimension)
+				results = _transliterate_all(values)
+			converted[to_convert] = results
+
+		values = converted.take(codes)
+		missing = codes == -1
+		if missing.any():
+			values[missing] = column.to_numpy(dtype=object)[missing]
+		return pd.Series(values, index=column.index, name=column.name, dtype=column.dtype)
 
+
+	def create_xmd(self, df, dataset_label, useNumericDefaults=True, default_measure_val="0.0", default_measure_fmt="0.0#", charset="UTF-8", deliminator=",", lineterminator="\r\n", 
+		sample_size=None):
+		'''
+			With useNumericDefaults=False the precision and scale of each numeric column are inferred from the data.  Set sample_size
+			to infer the scale from a random sample of that many rows first; the result is then checked against the whole column
+			so it is never smaller than what the data needs.
+		'''
+		fields = [self._xmd_field(c, df[c], useNumericDefaults=useNumericDefaults, default_measure_val=default_measure_val, 
+			default_measure_fmt=default_measure_fmt, sample_size=sample_size) for c in df.columns]
+		return json.dumps(self._xmd(fields, dataset_label, charset=charset, deliminator=deliminator, lineterminator=lineterminator))
+
+
+	def _xmd(self, fields, dataset_label, charset="UTF-8", deliminator=",", lineterminator="\r\n"):
+		dataset_api_name = dataset_label.replace(" ","_")
 		xmd = {
 			"fileFormat": {
 							"charsetName": charset,
@@ -533,14 +1827,161 @@ class salesforceEinsteinAnalytics(object):
 						}
 					]
 				}       
-		return str(xmd).replace("'",'"')
+		return xmd
+
+
+	def _xmd_field(self, label, column, useNumericDefaults=True, default_measure_val="0.0", default_measure_fmt="0.0#", sample_size=None):
+		'''
+			Returns the XMD field definition for one column.  label is the column name as it appears in the CSV header.
+		'''
+		name = str(label).replace(" ","_")
+		name = name.replace("__","_")
+		if pd.api.types.is_datetime64_dtype(column.dtype):
+			return {
+				"fullyQualifiedName": name,
+				"name": name,
+				"type": "Date",
+				"label": label,
+				"format": "yyyy-MM-dd HH:mm:ss"
+			}
+		elif pd.api.types.is_numeric_dtype(column.dtype) and not pd.api.types.is_bool_dtype(column.dtype):
+			if useNumericDefaults == True:
+				precision = 18
+				scale = 2
+			elif useNumericDefaults == False:
+				precision, scale = self._numeric_precision_scale(column, sample_size=sample_size)
+			return {
+				"fullyQualifiedName": name,
+				"name": name,
+				"type": "Numeric",
+				"label": label,
+				"precision": precision,
+				"defaultValue": default_measure_val,
+				"scale": scale,
+				"format": default_measure_fmt,
+				"decimalSeparator": "."
+			}
+		else:
+			return {
+				"fullyQualifiedName": name,
+				"name": name,
+				"type": "Text",
+				"label": label
+			}
+
+
+	def prepare_df(self, df, removeNONascii=True, ascii_columns=None, fillna=True, useNumericDefaults=True, default_measure_val="0.0", 
+		default_measure_fmt="0.0#", sample_size=None, build_xmd=True):
+		'''
+			Prepares a dataframe for upload in a single pass over its columns.  Returns (prepared_df, fields, timings).
+			1) With fillna=True missing values become 'NONE' in text columns, 0 in numeric columns and 1900-01-01 in date columns.
+			2) Non-ASCII characters are replaced in every text column, or only in ascii_columns if it is given (see remove_non_ascii).
+			3) "." is not allowed in dataset field names, so it is replaced with "_" in the column names.
+			4) fields is the list of XMD field definitions (see create_xmd), or None if build_xmd=False.
+			5) timings is a dataframe with the seconds spent preparing each column.
+			df itself is never modified.  Columns that need no changes are shared with prepared_df rather than copied.
+		'''
+		if ascii_columns is not None:
+			ascii_columns = set(ascii_columns)
+		elif removeNONascii == True:
+			ascii_columns = set(df.columns)
+		else:
+			ascii_columns = set()
+
+		columns = {}
+		fields = [] if build_xmd == True else None
+		timings = []
+		for c in df.columns:
+			start = time.perf_counter()
+			column = df[c]
+			if self._is_text(column) == True:
+				field_type = 'Text'
+				if fillna == True and column.isna().any():
+					column = column.fillna('NONE')
+				if c in ascii_columns:
+					column = self._ascii_column(column)
+			elif pd.api.types.is_datetime64_dtype(column.dtype):
+				field_type = 'Date'
+				if fillna == True and column.isna().any():
+					column = column.fillna(pd.to_datetime('1900-01-01 00:00:00'))
+			elif pd.api.types.is_numeric_dtype(column.dtype) and not pd.api.types.is_bool_dtype(column.dtype):
+				field_type = 'Numeric'
+				if fillna == True and column.isna().any():
+					column = column.fillna(0)
+			else:
+				field_type = 'Text'
+
+			label = c.replace(".","_") if isinstance(c, str) else c
+			if label in columns:
+				logging.error(' Column '+str(c)+' has the same name as another column once "." is replaced with "_"')
+				sys.exit(1)
+			columns[label] = column
+			if build_xmd == True:
+				field = self._xmd_field(label, column, useNumericDefaults=useNumericDefaults, default_measure_val=default_measure_val, 
+					default_measure_fmt=default_measure_fmt, sample_size=sample_size)
+				fields.append(field)
+				field_type = field['type']
+			timings.append({'Column': c, 'FieldName': label, 'Type': field_type, 'Seconds': time.perf_counter() - start})
+
+		prepared_df = pd.DataFrame(columns, index=df.index, copy=False)
+		return prepared_df, fields, pd.DataFrame(timings, columns=['Column', 'FieldName', 'Type', 'Seconds'])
+
+
+	def _numeric_precision_scale(self, column, sample_size=None, max_precision=18):
+		'''
+			Returns (precision, scale) for a numeric column.  The integer digits come from the largest absolute value and the scale 
+			is the fewest decimal places that hold every value.  A float counts as having s decimals when value*10**s is within a few 
+			ulps of a whole number, which matches its shortest repr.  The scale is reduced if needed so precision <= max_precision.
+		'''
+		if pd.api.types.is_integer_dtype(column.dtype):
+			values = column.dropna()
+			if values.empty:
+				return 1, 0
+			largest = max(abs(int(values.min())), abs(int(values.max())))
+			return min(len(str(largest)), max_precision), 0
+
+		values = column.to_numpy(dtype='float64', na_value=np.nan)
+		values = values[np.isfinite(values)]
+		if values.size == 0:
+			return 1, 0
+
+		largest = np.abs(values).max()
+		int_digits = int(np.floor(np.log10(largest))) + 1 if largest >= 1 else 1
+		max_scale = max(max_precision - int_digits, 0)
+
+		def fits(v, s):
+			scaled = np.abs(v) * 10.0**s
+			return np.abs(scaled - np.rint(scaled)) <= 4 * np.spacing(scaled)
+
+		def search(remaining, scale):
+			#a value that fits at s also fits at every larger s, so each pass only looks at the values still left
+			while remaining.size > 0 and scale < max_scale:
+				remaining = remaining[~fits(remaining, scale)]
+				if remaining.size > 0:
+					scale += 1
+			return scale
+
+		scale = 0
+		if sample_size is not None and values.size > sample_size:
+			scale = search(np.random.default_rng(0).choice(values, size=sample_size, replace=False), 0)
+		scale = search(values, scale)
+
+		return min(int_digits + scale, max_precision), scale
 
 
 	def load_df_to_EA(self, df, dataset_api_name, xmd=None, encoding='UTF-8', operation='Overwrite', useNumericDefaults=True, default_measure_val="0.0", max_request_attempts=3,
-		default_measure_fmt="0.0#", charset="UTF-8", deliminator=",", lineterminator="\r\n", removeNONascii=True, ascii_columns=None, fillna=True, dataset_label=None, verbose=False):
+		default_measure_fmt="0.0#", charset="UTF-8", deliminator=",", lineterminator="\r\n", removeNONascii=True, ascii_columns=None, fillna=True, dataset_label=None, max_workers=1, compress=False, xmd_sample_size=None, verbose=False):
 		'''
 			field names will show up exactly as the column names in the supplied dataframe
 			1) For available operations reference: https://developer.salesforce.com/docs/atlas.en-us.bi_dev_guide_ext_data.meta/bi_dev_guide_ext_data/bi_ext_data_object_externaldata.htm#topic-title
+			2) max_workers sets how many data parts are encoded and uploaded at the same time.  The data is only processed once 
+			every part has been uploaded.  Parts are resent by the session retry policy when the server turns them away 
+			(429/503); max_request_attempts is kept for backwards compatibility and has no effect.
+			3) compress=True gzips each data part before it is base64 encoded.  Parts are still sized against the 10MB limit,
+			so far fewer parts and bytes are sent for data that compresses well.
+			4) With useNumericDefaults=False, xmd_sample_size sets the sample used to infer numeric precision and scale (see create_xmd).
+			5) Returns an UploadJob.  Call job.wait() (or wait_for_completion) to block until the dataset has been processed;
+			job.timings shows where the time went.
 		'''
 
 		if verbose == True:		
@@ -548,46 +1989,98 @@ class salesforceEinsteinAnalytics(object):
 			print('Loading Data to Einstein Analytics...')
 			print('Process started at: '+str(self.get_local_time()))
 
-		dataset_api_name = dataset_api_name.replace(" ","_")
+		job = UploadJob(self)
+		prep_start = time.perf_counter()
+		dataset_api_name, upload_config, df = self._prepare_upload(df, dataset_api_name, xmd=xmd, encoding=encoding, operation=operation, useNumericDefaults=useNumericDefaults, 
+			default_measure_val=default_measure_val, default_measure_fmt=default_measure_fmt, charset=charset, deliminator=deliminator, lineterminator=lineterminator, 
+			removeNONascii=removeNONascii, ascii_columns=ascii_columns, fillna=fillna, xmd_sample_size=xmd_sample_size, verbose=verbose)
+		job.add_time('prep', time.perf_counter() - prep_start)
 
-		if fillna == True:
-			for c in df.columns:
-				if df[c].dtype == "O":
-					df[c].fillna('NONE', inplace=True)
-				elif np.issubdtype(df[c].dtype, np.number):
-					df[c].fillna(0, inplace=True)
-				elif df[c].dtype == "datetime64[ns]":
-					df[c].fillna(pd.to_datetime('1900-01-01 00:00:00'), inplace=True)
+		self._upload([df], upload_config, job, max_workers=max_workers, compress=compress, verbose=verbose)
+		
+		if verbose == True:
+			end = time.time()
+			print('Data Upload Process Started. Check Progress in Data Monitor or call wait_for_completion.')
+			print('Job ID: '+str(job.job_id))
+			print(self._format_timings(job))
+			print('Completed in '+str(round(end-start,3))+'sec')
 
+		return job
 
-		if ascii_columns is not None:
-			self.remove_non_ascii(df, columns=ascii_columns)
-		elif removeNONascii == True:
-			self.remove_non_ascii(df)
 
+	def load_iter_to_EA(self, frames, dataset_api_name, xmd=None, encoding='UTF-8', operation='Overwrite', useNumericDefaults=True, default_measure_val="0.0",
+		default_measure_fmt="0.0#", charset="UTF-8", deliminator=",", lineterminator="\r\n", removeNONascii=True, ascii_columns=None, fillna=True, max_workers=1, compress=False, xmd_sample_size=None, verbose=False):
+		'''
+			Loads any iterable of dataframes (e.g. pd.read_csv(..., chunksize=n)) without holding all of the data in memory.
+			1) Every chunk is cleaned the same way as in load_df_to_EA and aligned to the columns of the first chunk.
+			2) If xmd is not supplied it is created from the first chunk.  Pass an xmd when later chunks can hold 
+			longer numbers than the first one.
+			3) Rows from consecutive chunks are packed into the same data part, so chunk size does not change the number of parts.
+			4) max_workers, compress and xmd_sample_size work the same way as in load_df_to_EA, and an UploadJob is returned.
+		'''
 
-		## TODO ##
-		# Add logic to remove "." from column names.  The period character is not allowed for data table column names
+		if verbose == True:		
+			start = time.time()
+			print('Loading Data to Einstein Analytics...')
+			print('Process started at: '+str(self.get_local_time()))
 
+		frames = iter(frames)
+		first = next(frames, None)
+		if first is None:
+			logging.error(' No data to upload')
+			sys.exit(1)
+
+		job = UploadJob(self)
+		prep_start = time.perf_counter()
+		columns = first.columns
+		dataset_api_name, upload_config, first = self._prepare_upload(first, dataset_api_name, xmd=xmd, encoding=encoding, operation=operation, useNumericDefaults=useNumericDefaults, 
+			default_measure_val=default_measure_val, default_measure_fmt=default_measure_fmt, charset=charset, deliminator=deliminator, lineterminator=lineterminator, 
+			removeNONascii=removeNONascii, ascii_columns=ascii_columns, fillna=fillna, xmd_sample_size=xmd_sample_size, verbose=verbose)
+		job.add_time('prep', time.perf_counter() - prep_start)
+
+		def prepared():
+			yield first
+			for df in frames:
+				prep_start = time.perf_counter()
+				df = self.prepare_df(df.reindex(columns=columns), removeNONascii=removeNONascii, ascii_columns=ascii_columns, fillna=fillna, build_xmd=False)[0]
+				job.add_time('prep', time.perf_counter() - prep_start)
+				yield df
+
+		self._upload(prepared(), upload_config, job, max_workers=max_workers, compress=compress, verbose=verbose)
 		
-		# Upload Config Steps
-		if xmd is not None:
-			xmd64 = base64.urlsafe_b64encode(json.dumps(xmd).encode(encoding)).decode()
-		else:
-			xmd64 = base64.urlsafe_b64encode(self.create_xmd(df, dataset_api_name, useNumericDefaults=useNumericDefaults, default_measure_val=default_measure_val, 
-				default_measure_fmt=default_measure_fmt, charset=charset, deliminator=deliminator, lineterminator=lineterminator).encode(encoding)).decode()
+		if verbose == True:
+			end = time.time()
+			print('Data Upload Process Started. Check Progress in Data Monitor or call wait_for_completion.')
+			print('Job ID: '+str(job.job_id))
+			print(self._format_timings(job))
+			print('Completed in '+str(round(end-start,3))+'sec')
 
+		return job
 
-		upload_config = {
-						'Format' : 'CSV',
-						'EdgemartAlias' : dataset_api_name,
-						'Operation' : operation,
-						'Action' : 'None',
-						'MetadataJson': xmd64
-					}
 
+	def load_file_to_EA(self, path, dataset_api_name, chunk_size=100000, read_kwargs=None, verbose=False, **kwargs):
+		'''
+			Streams a CSV or Parquet file (.parquet/.pq) to Einstein Analytics chunk_size rows at a time.
+			read_kwargs are passed to pd.read_csv, other keyword arguments are passed to load_iter_to_EA.
+			Parquet files need pyarrow (pip install SalesforceEinsteinAnalytics[parquet]).
+		'''
+		read_kwargs = read_kwargs or {}
+		if path.lower().endswith(('.parquet', '.pq')):
+			import pyarrow.parquet as pq
+			parquet_file = pq.ParquetFile(path)
+			frames = (batch.to_pandas() for batch in parquet_file.iter_batches(batch_size=chunk_size))
+		else:
+			frames = pd.read_csv(path, chunksize=chunk_size, **read_kwargs)
+
+		return self.load_iter_to_EA(frames, dataset_api_name, verbose=verbose, **kwargs)
 
-		r1 = requests.post(self.env_url+'/services/data/v46.0/sobjects/InsightsExternalData', headers=self.header, data=json.dumps(upload_config))
+
+	def _upload(self, frames, upload_config, job, max_workers=1, compress=False, verbose=False):
+		'''
+			Creates the InsightsExternalData job, uploads the rows of frames as data parts and starts processing.  The job ID, 
+			part count and timings are recorded on job (an UploadJob).
+		'''
+		r1 = self._request('POST', '/services/data/v46.0/sobjects/InsightsExternalData', data=json.dumps(upload_config))
 		try:
 			json.loads(r1.text)['success'] == True
 		except: 
@@ -600,42 +2093,46 @@ class salesforceEinsteinAnalytics(object):
 			print('Chunking and Uploading Data Parts...')
 
 		
-		MAX_FILE_SIZE = 10 * 1000 * 1000 - 49
-		df_memory = sys.getsizeof(df)
-		rows_in_part = math.ceil(df.shape[0] / math.ceil(df_memory / MAX_FILE_SIZE))
-
-		partnum = 0
-		range_start = 0
-		max_data_part = rows_in_part
-		for chunk in range(0, math.ceil(df_memory / MAX_FILE_SIZE)):
-			df_part = df.iloc[range_start:max_data_part,:]
-			if chunk == 0:
-				data_part64 = base64.b64encode(df_part.to_csv(index=False, quotechar='"', quoting=csv.QUOTE_MINIMAL).encode('UTF-8')).decode()
-			else:
-				data_part64 = base64.b64encode(df_part.to_csv(index=False, header=False, quotechar='"', quoting=csv.QUOTE_MINIMAL).encode('UTF-8')).decode()
-			
-			range_start += rows_in_part
-			max_data_part += rows_in_part
-			partnum += 1
-			if verbose == True:
-				print('\rChunk '+str(chunk+1)+' of '+str(math.ceil(df_memory / MAX_FILE_SIZE))+' completed', end='', flush=True)
-
-			payload = {
-				"InsightsExternalDataId" : json.loads(r1.text)['id'],
-				"PartNumber" : str(partnum),
-				"DataFile" : data_part64
-			}
+		job_id = json.loads(r1.text)['id']
+		job.job_id = job_id
+
+		#the CSV for each part is written into one of max_workers+1 reusable buffers and base64 encoded straight into a
+		#request body kept per worker thread, so memory use stays near max_workers parts however much data there is
+		buffers = queue.Queue()
+		for i in range(0, max_workers + 1):
+			buffers.put(_PartBuffer(compress))
+		bodies = threading.local()
+
+		def upload_part(partnum, buf):
+			encode_start = time.perf_counter()
+			try:
+				body = self._part_body(job_id, partnum, buf, bodies)
+			finally:
+				buffers.put(buf)
+			job.add_time('encode', time.perf_counter() - encode_start)
+			#retries are left to the session policy, which resends a part only if the server turned it away (429/503)
+			upload_start = time.perf_counter()
+			r2 = self._request('POST', '/services/data/v46.0/sobjects/InsightsExternalDataPart', data=body)
+			job.add_time('upload', time.perf_counter() - upload_start)
+			if r2.ok == False:
+				raise EinsteinAnalyticsError('Datapart '+str(partnum)+' Upload Failed: '+r2.text)
+			return partnum
+
+		futures = []
+		with ThreadPoolExecutor(max_workers=max_workers) as pool:
+			try:
+				for partnum, buf in enumerate(self._iter_part_buffers(frames, buffers, job=job, verbose=verbose), start=1):
+					futures.append(pool.submit(upload_part, partnum, buf))
+			except EinsteinAnalyticsError as e:
+				logging.error(e)
+				sys.exit(1)
 
-			attempts = 0
-			while attempts < max_request_attempts:
-				try:
-					r2 = requests.post(self.env_url+'/services/data/v46.0/sobjects/InsightsExternalDataPart', headers=self.header, data=json.dumps(payload))
-					json.loads(r2.text)['success'] == True
-					break
-				except: 
-					attempts += 1
-					logging.error('\n Datapart Upload Failed', exc_info=True)
-					logging.debug(r2.text)
+		failed = [f.exception() for f in futures if f.exception() is not None]
+		if len(failed) > 0:
+			for e in failed:
+				logging.error(e)
+			logging.error('{} of {} data parts failed to upload.  The upload was not processed.'.format(len(failed), len(futures)))
+			sys.exit(1)
 					
 		
 		if verbose == True:
@@ -646,24 +2143,228 @@ class salesforceEinsteinAnalytics(object):
 					"Action" : "Process"
 				}
 
-		attempts = 0
-		while attempts < max_request_attempts:
-			try:
-				r3 = requests.patch(self.env_url+'/services/data/v46.0/sobjects/InsightsExternalData/'+json.loads(r1.text)['id'], headers=self.header, data=json.dumps(payload))
+		r3 = self._request('PATCH', '/services/data/v46.0/sobjects/InsightsExternalData/'+job_id, data=json.dumps(payload))
+		if r3.ok == False:
+			logging.error(' Process request failed for job '+job_id)
+			logging.error(r3.text)
+			sys.exit(1)
+		job.parts = len(futures)
+		job.processing_started = time.perf_counter()
+
+
+	_JOB_DONE_STATUSES = ('Completed', 'CompletedWithWarnings', 'Failed', 'NotProcessed')
+	_ASSET_TYPES = {'dashboard': 'dashboards', 'dashboards': 'dashboards', 'lens': 'lenses', 'lenses': 'lenses', 'dataset': 'datasets', 'datasets': 'datasets'}
+
+	def wait_for_completion(self, job_id, timeout=3600, poll_interval=2, poll_backoff=1.5, max_poll_interval=60, verbose=False):
+		'''
+			Polls the status of an upload job until the server has finished processing it and returns the InsightsExternalData 
+			record (Status, StatusMessage).  job_id can be an ID or the UploadJob returned by load_df_to_EA.
+			1) The first poll happens after poll_interval seconds and the wait grows by poll_backoff each time, up to max_poll_interval.
+			2) If the job is not finished after timeout seconds a warning is logged and the last record is returned.
+			3) Status is Completed, CompletedWithWarnings, Failed or NotProcessed once processing has finished.
+		'''
+		job = job_id if isinstance(job_id, UploadJob) else None
+		if job is not None:
+			job_id = job.job_id
+
+		start = time.perf_counter()
+		interval = poll_interval
+		record = None
+		last_status = None
+		while True:
+			time.sleep(max(min(interval, timeout - (time.perf_counter() - start)), 0))
+			r = self._request('GET', '/services/data/v46.0/sobjects/InsightsExternalData/'+job_id, params={'fields': 'Status,StatusMessage'})
+			if r.ok == True:
+				record = json.loads(r.text)
+				if verbose == True and record.get('Status') != last_status:
+					print('Job '+job_id+': '+str(record.get('Status'))+' ('+str(round(time.perf_counter()-start,1))+'sec)')
+				last_status = record.get('Status')
+				if last_status in self._JOB_DONE_STATUSES:
+					break
+			else:
+				logging.debug(r.text)
+
+			if time.perf_counter() - start >= timeout:
+				logging.warning(' Job '+job_id+' had not finished after '+str(timeout)+'sec')
 				break
-			except TimeoutError as e:
-				attempts += 1
-				logging.debug(sys.exc_info()[0])
-				logging.warning("Connection Timeout Error.  Trying again...")
-		
+			interval = min(interval * poll_backoff, max_poll_interval)
+
+		if job is not None:
+			job.status = last_status
+			if last_status in self._JOB_DONE_STATUSES:
+				job.timings['processing'] = time.perf_counter() - (job.processing_started or start)
+		if last_status in ('Failed', 'NotProcessed'):
+			logging.warning(' Job '+job_id+' '+last_status+': '+str(record.get('StatusMessage')))
+		if verbose == True and job is not None:
+			print(self._format_timings(job))
+		return record
+
+
+	def _format_timings(self, job):
+		return 'Timings: '+', '.join(phase+' '+(str(round(t,3))+'sec' if t is not None else '-') for phase, t in job.timings.items())
+
+
+	def _prepare_upload(self, df, dataset_api_name, xmd=None, encoding='UTF-8', operation='Overwrite', useNumericDefaults=True, default_measure_val="0.0", 
+		default_measure_fmt="0.0#", charset="UTF-8", deliminator=",", lineterminator="\r\n", removeNONascii=True, ascii_columns=None, fillna=True, xmd_sample_size=None, verbose=False):
+		'''
+			Prepares the dataframe for upload (see prepare_df) and returns the dataset API name, the InsightsExternalData upload config
+			and the prepared dataframe.
+		'''
+		dataset_api_name = dataset_api_name.replace(" ","_")
+
+		prepared_df, fields, timings = self.prepare_df(df, removeNONascii=removeNONascii, ascii_columns=ascii_columns, fillna=fillna, 
+			useNumericDefaults=useNumericDefaults, default_measure_val=default_measure_val, default_measure_fmt=default_measure_fmt, sample_size=xmd_sample_size, 
+			build_xmd=xmd is None)
+		logging.debug(timings.to_string())
 		if verbose == True:
-			end = time.time()
-			print('Data Upload Process Started. Check Progress in Data Monitor.')
-			print('Job ID: '+str(json.loads(r1.text)['id']))
-			print('Completed in '+str(round(end-start,3))+'sec')
+			slowest = timings.sort_values('Seconds', ascending=False).head(3)
+			print('Prepared '+str(timings.shape[0])+' columns in '+str(round(timings['Seconds'].sum(),3))+'sec (slowest: '+
+				', '.join(str(c)+' '+str(round(t,3))+'sec' for c, t in zip(slowest['Column'], slowest['Seconds']))+')')
+
+		# Upload Config Steps
+		if xmd is None:
+			xmd = self._xmd(fields, dataset_api_name, charset=charset, deliminator=deliminator, lineterminator=lineterminator)
+		xmd64 = base64.urlsafe_b64encode(json.dumps(xmd).encode(encoding)).decode()
+
+
+		upload_config = {
+						'Format' : 'CSV',
+						'EdgemartAlias' : dataset_api_name,
+						'Operation' : operation,
+						'Action' : 'None',
+						'MetadataJson': xmd64
+					}
 
+		return dataset_api_name, upload_config, prepared_df
 
-	def addArchivePrefix(self, warnList, prefix='[ARCHIVE] ', removePrefix=False, verbose=False):
+
+	def _iter_data_parts(self, df, compress=False, job=None, verbose=False):
+		'''
+			Yields the base64 encoded CSV (gzipped if compress=True) for each InsightsExternalDataPart.  Only the first part has a header row.
+			If job is given the encoding time is added to its timings.
+		'''
+		buffers = queue.Queue()
+		buffers.put(_PartBuffer(compress))
+		for buf in self._iter_part_buffers([df], buffers, job=job, verbose=verbose):
+			encode_start = time.perf_counter()
+			with buf.view() as data:
+				data64 = base64.b64encode(data).decode()
+			buffers.put(buf)
+			if job is not None:
+				job.add_time('encode', time.perf_counter() - encode_start)
+			yield data64
+
+
+	def _iter_part_buffers(self, frames, buffers, job=None, verbose=False):
+		'''
+			Packs the rows of an iterable of dataframes into data parts.  For each part a _PartBuffer is taken from the buffers 
+			queue, the CSV is written into it and it is yielded; the caller puts it back once the data has been used.  Rows are 
+			measured as they are written (after gzip when the buffers compress) so that every part is as close as possible to 
+			the DataFile limit once base64 encoded, without going over.  Only the first part has a header row.
+		'''
+		max_bytes = _MAX_PART_SIZE // 4 * 3
+		bytes_per_row = None
+		raw_per_row = None
+		header = True
+		empty = None
+		buf = None
+		buf_rows = 0
+		partnum = 0
+		total_rows = 0
+
+		for frame in frames:
+			if empty is None:
+				empty = frame.iloc[:0]
+			start = 0
+			while start < frame.shape[0]:
+				if buf is None:
+					buf = buffers.get()
+					buf.clear()
+					buf_rows = 0
+				mark = buf.mark()
+				room = max_bytes - buf.reserve - buf.size
+				if bytes_per_row is None:
+					rows = 1000
+				else:
+					rows = max(int(room * 0.99 / bytes_per_row), 1)
+				df_part = frame.iloc[start:start+rows]
+				encode_start = time.perf_counter()
+				self._render_part(df_part, header, buf, 1000 if raw_per_row is None else max(int(1024 * 1024 / raw_per_row), 100))
+				buf.sync()
+				if job is not None:
+					job.add_time('encode', time.perf_counter() - encode_start)
+				bytes_per_row = max((buf.size - mark[0]) / df_part.shape[0], 1)
+				raw_per_row = max((buf.raw_size - mark[1]) / df_part.shape[0], 1)
+
+				if buf.size + buf.reserve > max_bytes:
+					#roll back and retry with fewer rows, or close the part if not even one more row fits
+					buf.rollback(mark)
+					if df_part.shape[0] > 1:
+						continue
+					if buf_rows == 0:
+						raise EinsteinAnalyticsError('Row '+str(total_rows)+' is larger than the maximum data part size')
+				else:
+					header = False
+					start += df_part.shape[0]
+					buf_rows += df_part.shape[0]
+					total_rows += df_part.shape[0]
+					if buf.size + buf.reserve < max_bytes * 0.97:
+						continue
+
+				partnum += 1
+				buf.finish()
+				yield buf
+				buf = None
+				if verbose == True:
+					print('\rChunk '+str(partnum)+' completed ('+str(total_rows)+' rows)', end='', flush=True)
+
+		if buf is None and partnum == 0:
+			#no rows at all, upload the header on its own
+			buf = buffers.get()
+			buf.clear()
+			if empty is not None:
+				self._render_part(empty, True, buf, 1)
+		if buf is not None:
+			partnum += 1
+			buf.finish()
+			yield buf
+			if verbose == True:
+				print('\rChunk '+str(partnum)+' completed ('+str(total_rows)+' rows)', end='', flush=True)
+
+
+	def _render_part(self, df_part, header, buf, rows_per_write):
+		'''
+			Appends the CSV for df_part to buf.  The CSV is rendered rows_per_write rows at a time so only a small slice 
+			of it is ever held as a string.
+		'''
+		for i in range(0, max(df_part.shape[0], 1), rows_per_write):
+			buf.write(df_part.iloc[i:i+rows_per_write].to_csv(index=False, header=header and i == 0, quotechar='"', quoting=csv.QUOTE_MINIMAL).encode('UTF-8'))
+
+
+	def _part_body(self, job_id, partnum, buf, bodies):
+		'''
+			Builds the InsightsExternalDataPart request body for the CSV in buf.  The data is base64 encoded in slices directly into 
+			a bytearray kept on bodies (a threading.local) and reused for the next part.  Returns a memoryview over the body.
+		'''
+		prefix = ('{"InsightsExternalDataId": '+json.dumps(job_id)+', "PartNumber": '+json.dumps(str(partnum))+', "DataFile": "').encode()
+		suffix = b'"}'
+		step = 3 * 256 * 1024
+		with buf.view() as data:
+			length = len(prefix) + (len(data) + 2) // 3 * 4 + len(suffix)
+			body = getattr(bodies, 'body', None)
+			if body is None or len(body) < length:
+				body = bodies.body = bytearray(length)
+			body[0:len(prefix)] = prefix
+			pos = len(prefix)
+			for i in range(0, len(data), step):
+				chunk = binascii.b2a_base64(data[i:i+step], newline=False)
+				body[pos:pos+len(chunk)] = chunk
+				pos += len(chunk)
+			body[pos:pos+len(suffix)] = suffix
+		return memoryview(body)[:length]
+
+
+	def addArchivePrefix(self, warnList, prefix='[ARCHIVE] ', removePrefix=False, max_workers=None, rate_limit=None, verbose=False):
 		'''
 		Function to add a warning that an asset will soon be archived.  
 		The name of the dashboard will have the chosen prefix added.
@@ -671,227 +2372,334 @@ class salesforceEinsteinAnalytics(object):
 		max label length is 80 chars and is right trimmed if longer possibly erasing the original title
 
 		Adds prefix to existing label so running twice could overwrite original title
-		'''
 
-		for a in range(0,len(warnList)):
-			try:
-				r = requests.get(self.env_url+'/services/data/v46.0/wave/dashboards/'+warnList[a], headers=self.header)
-				currentLabel = json.loads(r.text)['label']
-				if removePrefix == True:
-					if currentLabel[:len(prefix)] == prefix: #adding check to make sure original lable isn't overwritten
-						newLabel = currentLabel[len(prefix):]
-				else:
-					newLabel = prefix+currentLabel
-				payload = {'label': newLabel[0:79]}
-				r = requests.patch(self.env_url+'/services/data/v46.0/wave/dashboards/'+warnList[a], headers=self.header, data=json.dumps(payload))
-				if json.loads(r.text)['label'] == prefix+currentLabel:
-					logging.debug('Successfully updated asset name for: '+warnList[a])
-				if verbose == True:
-						print('Progress: '+str(round(a/len(warnList)*100,1))+'%', end='', flush=True)
-			except:
-				try:
-					r = requests.get(self.env_url+'/services/data/v46.0/wave/lenses/'+warnList[a], headers=self.header)
-					currentLabel = json.loads(r.text)['label']
-					if removePrefix == True:
-						if currentLabel[:len(prefix)] == prefix: #adding check to make sure original lable isn't overwritten
-							newLabel = currentLabel[len(prefix):]
-					else:
-						newLabel = prefix+currentLabel
-					payload = {'label': newLabel[0:79]} #max char len for label = 80
-					r = requests.patch(self.env_url+'/services/data/v46.0/wave/lenses/'+warnList[a], headers=self.header, data=json.dumps(payload))
-					
-					#debugging code that should be removed
-					if json.loads(r.text)['label'] == prefix+currentLabel:
-						logging.debug('Successfully updated asset name for: '+warnList[a])
-					##########################################
-
-					if verbose == True:
-							print('Progress: '+str(round(a/len(warnList)*100,1))+'%', end='', flush=True)
-				except:
-					logging.warning(' could not update asset label: '+warnList[a])
+		warnList is a list of asset IDs or a dataframe with an id column and optional type and label columns (the output of 
+		getMetaData can be used as is).  See _asset_frame for how missing types and labels are found.  The labels are updated 
+		concurrently (max_workers defaults to the pool size) and rate_limit caps the number of updates started per second.
+		Returns a dataframe with one row per asset: id, type, old_label, new_label, status (success, skipped or error), 
+		message and latency (seconds).
+		'''
+		assets = self._asset_frame(warnList, need_label=True, max_workers=max_workers)
+
+		def relabel(asset):
+			currentLabel = asset['label']
+			if currentLabel is None:
+				r = self._request('GET', '/services/data/v46.0/wave/'+asset['type']+'/'+asset['id'])
+				if r.ok == False:
+					return {'status': 'error', 'message': r.text}
+				currentLabel = r.json()['label']
+			newLabel = self._prefixed_label(currentLabel, prefix, removePrefix)
+			if newLabel is None:
+				return {'old_label': currentLabel, 'status': 'skipped', 'message': 'label does not start with the prefix'}
+			r = self._request('PATCH', '/services/data/v46.0/wave/'+asset['type']+'/'+asset['id'], data=json.dumps({'label': newLabel}))
+			if r.ok == False or r.json().get('label') != newLabel:
+				return {'old_label': currentLabel, 'status': 'error', 'message': r.text}
+			logging.debug('Successfully updated asset name for: '+asset['id'])
+			return {'old_label': currentLabel, 'new_label': newLabel, 'status': 'success'}
+
+		return self._update_assets(assets, relabel, ['id', 'type', 'old_label', 'new_label', 'status', 'message', 'latency'], 
+			max_workers=max_workers, rate_limit=rate_limit, verbose=verbose)
 		
 
-	def archiveAssets(self, archiveAppId, ToMoveList, verbose=False):
+	def _prefixed_label(self, currentLabel, prefix, removePrefix=False):
 		'''
-		I need to change the archiveAssets function to use a dataframe.  Requireing an asset type will prevent the need
-		to try dashboards first, reducing the compute time.  It will also prevent issues of archiving a dashboard when you 
-		are trying to archive a lens.  Also, I need to create a dataframe output with the results and not just stdout.
+			Returns the label with the prefix added (or removed), trimmed to the max label length.
+			Returns None if the prefix should be removed but the label doesn't start with it.
 		'''
+		if removePrefix == True:
+			if currentLabel[:len(prefix)] != prefix: #adding check to make sure original lable isn't overwritten
+				return None
+			newLabel = currentLabel[len(prefix):]
+		else:
+			newLabel = prefix+currentLabel
+		return newLabel[0:79] #max char len for label = 80
 
-		payload = {'folder': {'id':archiveAppId} }
 
-		for a in range(0,len(ToMoveList)):
-			try:
-				r = requests.patch(self.env_url+'/services/data/v46.0/wave/dashboards/'+ToMoveList[a], headers=self.header, data=json.dumps(payload) )
-				if json.loads(r.text)['folder']['id'] == archiveAppId: #check to ensure response has new folder id
-					if verbose == True:
-						print('Progress: '+str(round(a/len(ToMoveList)*100,1))+'%', end='', flush=True)	
-					logging.debug('Successfully archived (type=dashboard): '+ToMoveList[a])
-			except:
-				# if response does not contain the new folder id then try same command for a lens
-				try:
-					r = requests.patch(self.env_url+'/services/data/v46.0/wave/lenses/'+ToMoveList[a], headers=self.header, data=json.dumps(payload) )
-					if json.loads(r.text)['folder']['id'] == archiveAppId: #check to ensure response has new folder id
-						if verbose == True:
-							print('Progress: '+str(round(a/len(ToMoveList)*100,1))+'%', end='', flush=True)
-						logging.debug('Successfully archived (type=lens): '+ToMoveList[a])
-				except:
-					logging.warning(' could not move asset: '+ToMoveList[a])
+	def archiveAssets(self, archiveAppId, ToMoveList, max_workers=None, rate_limit=None, verbose=False):
+		'''
+			Moves assets to the archive app archiveAppId.  ToMoveList is a list of asset IDs or a dataframe with an id column and 
+			optional type and folder.id columns (the output of getMetaData can be used as is).  Each asset is PATCHed on the 
+			endpoint of its type, concurrently (max_workers defaults to the pool size) and rate_limit caps the number of moves 
+			started per second.  Returns a dataframe with one row per asset: id, type, old_folder, new_folder, status 
+			(success, skipped or error), message and latency (seconds).
+		'''
+		assets = self._asset_frame(ToMoveList, max_workers=max_workers)
+		payload = json.dumps({'folder': {'id':archiveAppId} })
 
+		def move(asset):
+			if asset['folder'] == archiveAppId:
+				return {'old_folder': asset['folder'], 'new_folder': archiveAppId, 'status': 'skipped', 'message': 'already in the archive app'}
+			r = self._request('PATCH', '/services/data/v46.0/wave/'+asset['type']+'/'+asset['id'], data=payload)
+			if r.ok == False or (r.json().get('folder') or {}).get('id') != archiveAppId: #check to ensure response has new folder id
+				return {'old_folder': asset['folder'], 'status': 'error', 'message': r.text}
+			logging.debug('Successfully archived (type='+asset['type']+'): '+asset['id'])
+			return {'old_folder': asset['folder'], 'new_folder': archiveAppId, 'status': 'success'}
 
+		return self._update_assets(assets, move, ['id', 'type', 'old_folder', 'new_folder', 'status', 'message', 'latency'], 
+			max_workers=max_workers, rate_limit=rate_limit, verbose=verbose)
 
-	def getMetaData(self, appIdList, objectList=['dashboards','lenses','datasets'], max_request_attempts=3, verbose=False):
-		
-		progress_counter = 0
-		assets_df = pd.DataFrame()
 
-		for a in appIdList:
-			if verbose == True:
-				progress_counter += 1
-				print('Progress: '+str(round(progress_counter/len(appIdList)*100,1))+'%', end='', flush=True)
-			params = {'pageSize': 50, 'sort': 'Mru', 'hasCurrentOnly': 'true', 'folderId': a}
-			
-			for obj in objectList:
-				attempts = 0
-				while attempts < max_request_attempts:
-					try:
-						r1 = requests.get(self.env_url+'/services/data/v46.0/wave/'+obj, headers=self.header, params=params)
-						response = json.loads(r1.text)
-						app_assets_df = json_normalize(response[obj])
-						total_size = response['totalSize']
-						try:
-							next_page = json.loads(r1.text)['nextPageUrl']
-						except KeyError as e:
-							logging.debug(e)
-							next_page = None
-						break
-					except:
-						attempts += 1
-						logging.warning("Unexpected error:", sys.exc_info()[0])
-						logging.warning("Trying again...")
-				assets_df = pd.concat([assets_df,app_assets_df], ignore_index=True)
-
-				#continue to pull data from next page if found
-				attempts = 0 # reset attempts for additional pages
-				while next_page is not None:
-					while attempts < max_request_attempts:
-						try:
-							r1 = requests.get(self.env_url+next_page, headers=self.header, params=params)
-							app_assets_df = json_normalize(json.loads(r1.text)[obj])
-							try:
-								next_page = json.loads(r1.text)['nextPageUrl']
-							except KeyError as e:
-								logging.debug(e)
-								next_page = None
-							break
-						except:
-							attempts += 1
-							logging.warning("Unexpected error:", sys.exc_info()[0])
-							logging.warning("Trying again...")
-					assets_df = pd.concat([assets_df,app_assets_df], ignore_index=True)
-		for i in assets_df.columns[assets_df.columns.str.contains('Date')]:
+	def _asset_frame(self, assets, need_label=False, max_workers=None):
+		'''
+			Returns a list of {id, type, label, folder} dicts for a list of asset IDs or a dataframe with an id column.  type may be 
+			given as dashboard(s), lens(es) or dataset(s).  Missing types (and labels when need_label=True) are filled in by listing 
+			the dashboards and lenses the user can see, so that each asset is sent to its own endpoint.  Assets that are not 
+			found keep type None.
+		'''
+		if isinstance(assets, pd.DataFrame):
+			columns = {'id': 'id', 'type': 'type', 'label': 'label', 'folder': 'folder.id'}
+			frame = assets.reindex(columns=list(columns.values())).rename(columns={v: k for k, v in columns.items()})
+			frame = frame.astype(object).where(frame.notna(), None)
+			assets = frame.to_dict('records')
+		else:
+			assets = [{'id': a, 'type': None, 'label': None, 'folder': None} for a in assets]
+		for asset in assets:
+			asset['type'] = self._ASSET_TYPES.get(asset['type'])
+
+		missing = [a for a in assets if a['type'] is None or (need_label == True and a['label'] is None)]
+		if len(missing) > 0:
+			objects = sorted(set(obj for a in missing for obj in ([a['type']] if a['type'] is not None else ['dashboards', 'lenses'])))
+			outcomes = self._run_concurrent(lambda obj: self._list_assets(None, obj), objects, max_workers=max_workers, error_message='Could not list {}')
+			found = {record['id']: (obj, record) for obj, (records, error, latency) in zip(objects, outcomes) if error is None for record in records}
+			for asset in missing:
+				if asset['id'] in found:
+					asset['type'], record = found[asset['id']]
+					asset['label'] = record.get('label')
+					asset['folder'] = asset['folder'] or (record.get('folder') or {}).get('id')
+		return assets
+
+
+	def _update_assets(self, assets, update, columns, max_workers=None, rate_limit=None, verbose=False):
+		'''
+			Runs update(asset) for each asset dict concurrently and returns the result rows as a dataframe in input order.
+			update returns a dict of result columns; exceptions are reported as errors.
+		'''
+		if verbose == True:
+			start = time.time()
+			print('Updating '+str(len(assets))+' assets...')
+
+		def run(asset):
+			if asset['type'] is None:
+				raise EinsteinAnalyticsError('asset was not found as a dashboard or lens')
+			return update(asset)
+
+		outcomes = self._run_concurrent(run, assets, max_workers=max_workers, rate_limit=rate_limit, 
+			error_message='Could not update asset {0[id]}', verbose=verbose)
+		rows = []
+		for asset, (result, error, latency) in zip(assets, outcomes):
+			if error is not None:
+				result = {'status': 'error', 'message': str(error)}
+			elif result['status'] == 'error':
+				logging.warning('Could not update asset '+str(asset['id'])+': '+str(result.get('message')))
+			rows.append(dict(result, id=asset['id'], type=asset['type'], latency=latency))
+
+		results = pd.DataFrame(rows, columns=columns)
+		if verbose == True:
+			print('\n'+str((results['status'] == 'success').sum())+' updated, '+str((results['status'] == 'skipped').sum())+' skipped, '+
+				str((results['status'] == 'error').sum())+' failed')
+			print('Completed in '+str(round(time.time()-start,3))+'sec')
+		return results
+
+
+	def getMetaData(self, appIdList, objectList=['dashboards','lenses','datasets'], max_request_attempts=3, max_workers=None, verbose=False):
+		'''
+			Returns a dataframe with the metadata of every asset of the types in objectList in the apps in appIdList.
+			Each (app, asset type) pair is listed concurrently (max_workers defaults to the pool size) with 200 assets per page.
+			Pairs that fail are skipped with a warning.  max_request_attempts is kept for backwards compatibility, retries are 
+			handled by the session.
+		'''
+		pairs = [(a, obj) for a in appIdList for obj in objectList]
+		outcomes = self._run_concurrent(lambda pair: self._list_assets(*pair), pairs, max_workers=max_workers, 
+			error_message='Could not get {0[1]} for app {0[0]}', verbose=verbose)
+		assets_df = json_normalize([record for records, error, latency in outcomes if error is None for record in records])
+		return self._parse_asset_dates(assets_df)
+
+
+	def _list_assets(self, app_id, obj):
+		'''
+			Returns the json for every asset of type obj (dashboards, lenses, datasets...) in an app (in every app if app_id is None), 
+			following nextPageUrl.
+		'''
+		params = {'pageSize': 200, 'sort': 'Mru', 'hasCurrentOnly': 'true', 'folderId': app_id}
+		response = self._get_json('/services/data/v46.0/wave/'+obj, params=params)
+		records = response[obj]
+		next_page = response.get('nextPageUrl')
+		while next_page is not None:
+			response = self._get_json(next_page)
+			records.extend(response[obj])
+			next_page = response.get('nextPageUrl')
+		return records
+
+
+	def _get_json(self, url, params=None):
+		'''
+			GETs url and returns the parsed json.  Retries are left to the session policy, so a failed response raises
+			EinsteinAnalyticsError straight away.
+		'''
+		r = self._request('GET', url, params=params)
+		try:
+			if r.ok == True:
+				return r.json()
+		except ValueError:
+			pass
+		raise EinsteinAnalyticsError('GET '+url+' failed ('+str(r.status_code)+'): '+r.text)
+
+
+	def _run_concurrent(self, fn, items, max_workers=None, rate_limit=None, error_message='Could not process {}', verbose=False):
+		'''
+			Calls fn(item) for each item on a thread pool (max_workers defaults to the pool size), starting no more than 
+			rate_limit calls per second.  Returns a list of (result, exception, latency) tuples in input order, where exception 
+			is None when the call succeeded and latency is in seconds.  Failures are logged with error_message.format(item).
+		'''
+		items = list(items)
+		outcomes = [None] * len(items)
+		if len(items) == 0:
+			return outcomes
+
+		limiter = _RateLimiter(rate_limit)
+		def run(item):
+			limiter.wait()
+			t = time.perf_counter()
+			try:
+				return fn(item), None, time.perf_counter() - t
+			except Exception as e:
+				logging.warning(error_message.format(item)+': '+str(e))
+				return None, e, time.perf_counter() - t
+
+		with ThreadPoolExecutor(max_workers=min(max_workers or self.max_workers, len(items))) as pool:
+			futures = {pool.submit(run, item): i for i, item in enumerate(items)}
+			for completed, future in enumerate(as_completed(futures), start=1):
+				outcomes[futures[future]] = future.result()
+				if verbose == True:
+					print('\rProgress: '+str(round(completed/len(items)*100,1))+'%', end='', flush=True)
+		return outcomes
+
+
+	def _parse_asset_dates(self, assets_df):
+		for i in [c for c in assets_df.columns if 'Date' in str(c)]:
 			try:
-				assets_df[i].fillna('1900-01-01T00:00:00.000Z', inplace=True)
-				assets_df[i] = assets_df[i].apply(lambda x: pd.to_datetime(x))
+				assets_df[i] = pd.to_datetime(assets_df[i].fillna('1900-01-01T00:00:00.000Z'), utc=True)
 			except:
 				logging.warning("Fill NA failed for column: {}".format(i))
 		return assets_df
 
 
-	def getAssetCounts(self, appIdList=None, countsToReturn=['dashboards','lenses','datasets'], max_request_attempts=3, verbose=False):
+	def getAssetCounts(self, appIdList=None, countsToReturn=['dashboards','lenses','datasets'], max_request_attempts=3, countOnly=False, max_workers=None, verbose=False):
+		'''
+			Returns a dataframe with the number of assets of each type in countsToReturn per app (all apps if appIdList is None).
+			1) With countOnly=True a single asset is requested per app and asset type and the count is read from totalSize,
+			instead of downloading the metadata of every asset.  The requests run concurrently (max_workers defaults to the pool size).
+			2) In countOnly mode apps without any of the assets are included with zero counts.  Their label is only known when 
+			appIdList is None.
+			Both modes return a count column for every type in countsToReturn, with 0 where there are no assets of that type.
+		'''
+		labels = {}
+		if appIdList is None:
+			folders = self._list_folders()
+			appIdList = [f['id'] for f in folders]
+			labels = {f['id']: f.get('label') for f in folders}
+			if verbose == True:
+				print('Getting asset counts for '+str(len(appIdList))+' apps.') 
 
-		if appIdList is not None:
-			df = self.getMetaData(appIdList=appIdList, objectList=countsToReturn, verbose=verbose)
-			df = df.groupby(['folder.id','folder.label','type'], as_index=True).agg({'id':['count']})
-			df = df.pivot_table('id', ['folder.id', 'folder.label'], 'type')
-			df.columns = df.columns.droplevel()
-			df = df.reset_index()
+		updateColNames = {
+							'dashboard': 'dashboardCount',
+							'dataset': 'datasetCount',
+							'lens': 'lensCount',
+						}
 
-			updateColNames = {
-								'dashboard': 'dashboardCount',
-								'dataset': 'datasetCount',
-								'lens': 'lensCount',
-							}
+		if countOnly == True:
+			df = self._count_assets(appIdList, countsToReturn, labels, max_workers=max_workers, verbose=verbose)
+		else:
+			df = self.getMetaData(appIdList=appIdList, objectList=countsToReturn, max_workers=max_workers, verbose=verbose)
+			if df.empty == True:
+				df = pd.DataFrame(columns=['folder.id', 'folder.label'])
+			else:
+				df = df.groupby(['folder.id','folder.label','type']).size().unstack('type', fill_value=0).reset_index()
+			columns = sorted(self._ASSET_SINGULAR.get(obj, obj) for obj in countsToReturn)
+			df = df.reindex(columns=['folder.id', 'folder.label'] + columns, fill_value=0)
 
-			df.rename(columns=updateColNames, inplace=True)
-			df.columns.names = ['index']			
+		df = df.rename(columns=updateColNames)
+		df.columns.names = ['index']
 
-		else:
-			progress_counter = 0
-			params = {'pageSize': 50}
-
-			# get list of all folders that the user has access to
-			r = requests.get(self.env_url+'/services/data/v48.0/wave/folders', headers=self.header, params=params)
-			response = json.loads(r.text)
-			apps_df = pd.json_normalize(response['folders'])
-			total_size = response['totalSize']
-			next_page = response['nextPageUrl']
-
-			#continue to pull data from next page if found
-			attempts = 0 # reset attempts for additional pages
-			while next_page is not None:
-				progress_counter += 50
-				if verbose == True:
-					print('Collecting App List Progress: '+str(round(progress_counter/total_size*100,1))+'%', end='', flush=True)
-				while attempts < max_request_attempts:
-					try:
-						r1 = requests.get(self.env_url+next_page, headers=self.header, params=params)
-						np_df = json_normalize(json.loads(r1.text)['folders'])
-						try:
-							next_page = json.loads(r1.text)['nextPageUrl']
-						except KeyError as e:
-							logging.debug(e)
-							next_page = None
-						break
-					except:
-						attempts += 1
-						logging.warning("Unexpected error:", sys.exc_info()[0])
-						logging.warning("Trying again...")
-				apps_df = pd.concat([apps_df,np_df], ignore_index=True)
+		return df
 
-			if verbose == True:
-				print('Getting asset counts for '+len(apps_df['id'].tolist())+' apps.') 
-			
-			df = self.getMetaData(appIdList=apps_df['id'].tolist(), objectList=countsToReturn, verbose=verbose)
-			df = df.groupby(['folder.id','folder.label','type'], as_index=True).agg({'id':['count']})
-			df = df.pivot_table('id', ['folder.id', 'folder.label'], 'type')
-			df.columns = df.columns.droplevel()
-			df = df.reset_index()
 
-			updateColNames = {
-								'dashboard': 'dashboardCount',
-								'dataset': 'datasetCount',
-								'lens': 'lensCount',
-							}
+	_ASSET_SINGULAR = {'dashboards': 'dashboard', 'lenses': 'lens', 'datasets': 'dataset'}
 
-			df.rename(columns=updateColNames, inplace=True)
-			df.columns.names = ['index']
+	def _count_assets(self, appIdList, objectList, labels, max_workers=None, verbose=False):
+		'''
+			Counts the assets of each type in objectList per app from the totalSize of a one-record page.
+		'''
+		singular = self._ASSET_SINGULAR
+
+		def count(app, obj):
+			params = {'pageSize': 1, 'hasCurrentOnly': 'true', 'folderId': app}
+			response = self._get_json('/services/data/v46.0/wave/'+obj, params=params)
+			label = response[obj][0].get('folder', {}).get('label') if len(response[obj]) > 0 else None
+			return response['totalSize'], label
+
+		rows = {a: {'folder.id': a, 'folder.label': labels.get(a)} for a in appIdList}
+		pairs = [(a, obj) for a in appIdList for obj in objectList]
+		outcomes = self._run_concurrent(lambda pair: count(*pair), pairs, max_workers=max_workers, 
+			error_message='Could not count {0[1]} for app {0[0]}', verbose=verbose)
+		for (a, obj), (counted, error, latency) in zip(pairs, outcomes):
+			if error is None:
+				rows[a][singular.get(obj, obj)] = counted[0]
+				if rows[a]['folder.label'] is None:
+					rows[a]['folder.label'] = counted[1]
+
+		columns = sorted(singular.get(obj, obj) for obj in objectList)
+		return pd.DataFrame(list(rows.values()), columns=['folder.id', 'folder.label'] + columns)
+
+
+	def metadata_store(self, path=None, objectList=['dashboards','lenses','datasets']):
+		'''
+			Opens the local metadata snapshot of this org (see MetadataStore).  Call sync() on it to bring it up to date.
+			path defaults to a file per org in the user cache directory, ':memory:' keeps it in memory.
+		'''
+		if path is None:
+			path = os.path.join(_cache_dir(), 'metadata_'+hashlib.sha1(self.env_url.encode('utf-8')).hexdigest()[:16]+'.sqlite')
+		return MetadataStore(self, path, objectList=objectList)
 
-		return df
 
 	def get_dashboard_dataset_usage(self, appIdList, verbose=False):
+		'''
+			Returns a dataframe with a row for every dataset used by each dashboard in the apps in appIdList.
+		'''
 
 		#https://developer.salesforce.com/docs/atlas.en-us.bi_dev_guide_rest.meta/bi_dev_guide_rest/bi_resources_dependencies_id.htm
 
 		appAssets = self.getMetaData(appIdList=appIdList, objectList=['dashboards'], verbose=verbose)
-		ds_to_db = pd.DataFrame()
-
-		for d in appAssets['id']:
-			ds = appAssets[appAssets['id'] == d]
-			for i in range(0,len(ds['datasets'].tolist()[0])):
-				newRow = {
-					'App_ID': ds['folder.id'].values,
-					'App_Name': ds['folder.label'].values,
-					'Dashboard_ID': [d],
-					'Dashboard_APIName': ds['name'].values,
-					'Dashboard_Name': ds['label'].values,
-					'Dataset_ID': [ds['datasets'].tolist()[0][i].get('id')],
-					'Dataset_APIName': [ds['datasets'].tolist()[0][i].get('name')],
-					'Dataset_Name': [ds['datasets'].tolist()[0][i].get('label')]
-				}
-				ds_to_db = pd.concat([ds_to_db,pd.DataFrame(newRow)], ignore_index=True)
+		return self._dashboard_dataset_rows(appAssets)
+
 
-		return ds_to_db
+	def get_lineage_index(self, appIdList, verbose=False):
+		'''
+			Crawls the dashboards in the apps in appIdList once and returns a LineageIndex for dataset/dashboard/app lookups.
+		'''
+		return LineageIndex(self.get_dashboard_dataset_usage(appIdList, verbose=verbose))
+
+
+	def _dashboard_dataset_rows(self, appAssets):
+		columns = ['App_ID', 'App_Name', 'Dashboard_ID', 'Dashboard_APIName', 'Dashboard_Name', 'Dataset_ID', 'Dataset_APIName', 'Dataset_Name']
+		if appAssets.empty == True or 'datasets' not in appAssets.columns:
+			return pd.DataFrame(columns=columns)
+
+		usage = appAssets.reindex(columns=['folder.id', 'folder.label', 'id', 'name', 'label', 'datasets']).explode('datasets', ignore_index=True)
+		usage = usage[usage['datasets'].map(lambda x: isinstance(x, dict))]
+		datasets = pd.DataFrame(usage['datasets'].tolist(), index=usage.index)
+
+		ds_to_db = pd.DataFrame({
+			'App_ID': usage['folder.id'],
+			'App_Name': usage['folder.label'],
+			'Dashboard_ID': usage['id'],
+			'Dashboard_APIName': usage['name'],
+			'Dashboard_Name': usage['label'],
+			'Dataset_ID': datasets.get('id'),
+			'Dataset_APIName': datasets.get('name'),
+			'Dataset_Name': datasets.get('label')
+		}, columns=columns)
+		return ds_to_db.reset_index(drop=True)
 
 	def update_dashboard_access(self, update_df, update_type, verbose=True):
 		'''
@@ -0,0 +1,475 @@
+#Asyncio client for the Einstein Analytics API
+
+#core libraries
+import logging
+import json
+import time
+import asyncio
+
+from SalesforceEinsteinAnalytics.SFDC_EA import salesforceEinsteinAnalytics, EinsteinAnalyticsError, UploadJob, json_normalize, pd
+
+
+class _AsyncResponse(object):
+	'''
+		Response body and status read from an aiohttp request, so it can be used after the connection is released.
+	'''
+	def __init__(self, status_code, text):
+		self.status_code = status_code
+		self.text = text
+		self.ok = status_code < 400
+
+	def json(self):
+		return json.loads(self.text)
+
+
+class salesforceEinsteinAnalyticsAsync(object):
+	'''
+		Asyncio version of salesforceEinsteinAnalytics.  The API methods are coroutines that take the same arguments as the
+		synchronous client and all requests are multiplexed over one aiohttp connection pool (requires aiohttp).
+		Errors are raised as EinsteinAnalyticsError instead of exiting the process.
+
+		async with salesforceEinsteinAnalyticsAsync(env_url='https://yourinstance.my.salesforce.com', browser='chrome') as EA:
+			df = await EA.run_saql_query(saql)
+
+		The synchronous client is available as .client and shares its dataset and query caches with this one.
+	'''
+	_RETRY_STATUS = (429, 500, 502, 503, 504)
+
+	def __init__(self, env_url, browser, rawcookie=None, cookiefile=None, logLevel='WARN', pool_size=100, max_retries=3, backoff_factor=0.5, timeout=300, **kwargs):
+		self.client = salesforceEinsteinAnalytics(env_url, browser, rawcookie=rawcookie, cookiefile=cookiefile, logLevel=logLevel, pool_size=pool_size,
+			max_retries=max_retries, backoff_factor=backoff_factor, timeout=timeout, **kwargs)
+		self.env_url = env_url
+		self.header = self.client.header
+		self.pool_size = pool_size
+		self.max_retries = max_retries
+		self.backoff_factor = backoff_factor
+		self.timeout = timeout
+		self._session = None
+
+
+	async def __aenter__(self):
+		return self
+
+
+	async def __aexit__(self, *exc_info):
+		await self.close()
+
+
+	async def close(self):
+		if self._session is not None:
+			await self._session.close()
+			self._session = None
+		self.client.session.close()
+
+
+	def _get_session(self):
+		#the aiohttp session has to be created inside the running event loop
+		if self._session is None or self._session.closed:
+			import aiohttp
+			connector = aiohttp.TCPConnector(limit=self.pool_size)
+			self._session = aiohttp.ClientSession(headers=self.header, connector=connector, timeout=aiohttp.ClientTimeout(total=self.timeout))
+		return self._session
+
+
+	async def _request(self, method, url, **kwargs):
+		'''
+			Sends a request through the shared aiohttp session.  Urls starting with "/" are joined to env_url.
+			Uses the same retry policy as the synchronous client (see _SessionRetry): connection errors, 429 and 503 are 
+			retried for every method, timeouts and other 5xx responses only for idempotent methods.  Retries use exponential backoff.
+		'''
+		import aiohttp
+		if url.startswith('/'):
+			url = self.env_url+url
+		session = self._get_session()
+		idempotent = method.upper() not in ('POST', 'PATCH')
+		attempt = 0
+		while True:
+			retry_after = None
+			try:
+				async with session.request(method, url, **kwargs) as r:
+					text = await r.text()
+					retry = r.status in self._RETRY_STATUS and (idempotent == True or r.status in (429, 503))
+					if retry == False or attempt >= self.max_retries:
+						return _AsyncResponse(r.status, text)
+					retry_after = r.headers.get('Retry-After')
+			except aiohttp.ClientConnectorError:
+				if attempt >= self.max_retries:
+					raise
+			except (aiohttp.ClientError, asyncio.TimeoutError):
+				if attempt >= self.max_retries or idempotent == False:
+					raise
+			delay = self.backoff_factor * (2 ** attempt)
+			if retry_after is not None and retry_after.isdigit():
+				delay = max(delay, int(retry_after))
+			attempt += 1
+			await asyncio.sleep(delay)
+
+
+	async def _get_json(self, url, params=None):
+		'''
+			GETs url and returns the parsed json.  Raises EinsteinAnalyticsError if the request fails.
+		'''
+		r = await self._request('GET', url, params=params)
+		try:
+			if r.ok == True:
+				return r.json()
+		except ValueError:
+			pass
+		raise EinsteinAnalyticsError('GET '+url+' failed ('+str(r.status_code)+'): '+r.text)
+
+
+	async def _gather(self, coroutines, items, error_message='Could not process {}'):
+		'''
+			Awaits the coroutines together and returns their results in order.  As in the synchronous _run_concurrent, a coroutine
+			that fails is logged with error_message.format(item) and its result is None instead of failing the whole batch.
+		'''
+		results = []
+		for item, result in zip(items, await asyncio.gather(*coroutines, return_exceptions=True)):
+			if isinstance(result, BaseException):
+				if not isinstance(result, Exception):
+					raise result
+				logging.warning(error_message.format(item)+': '+str(result))
+				result = None
+			results.append(result)
+		return results
+
+
+	async def get_dataset_id(self, dataset_name, search_type='API Name', verbose=False, use_cache=True):
+		resolved = await self.resolve_datasets([dataset_name], search_type=search_type, use_cache=use_cache, verbose=verbose)
+		if dataset_name not in resolved:
+			raise EinsteinAnalyticsError('Dataset search for {} failed to return a result.  Ensure you have access to the dataset and review the Troubleshooting section in the documentation'.format(dataset_name))
+		return resolved[dataset_name]
+
+
+	async def resolve_datasets(self, dataset_names, search_type='API Name', use_cache=True, verbose=False):
+		if search_type not in ('API Name', 'ID', 'UI Label'):
+			raise EinsteinAnalyticsError('select an available search_type: API Name, ID, or UI Label')
+
+		resolved = {}
+		to_lookup = []
+		for n in dict.fromkeys(dataset_names):
+			cached = self.client.dataset_cache.get((self.env_url, search_type, n)) if use_cache == True else None
+			if cached is not None:
+				resolved[n] = cached
+			else:
+				to_lookup.append(n)
+
+		from_cache = len(resolved)
+		if search_type == 'ID':
+			batches = [to_lookup[i:i+100] for i in range(0, len(to_lookup), 100)]
+		else:
+			batches = [[n] for n in to_lookup]
+		lookups = await self._gather([self._lookup_datasets(b, search_type) for b in batches], batches, error_message='Dataset search for {} failed')
+		for batch, results in zip(batches, lookups):
+			for n, ds in results if results is not None else [(n, None) for n in batch]:
+				if ds is not None:
+					resolved[n] = ds
+				else:
+					logging.warning('Dataset search for {} failed to return a result.'.format(n))
+
+		if verbose == True:
+			print('Resolved '+str(len(resolved))+' datasets ('+str(from_cache)+' from cache).')
+		return resolved
+
+
+	async def _lookup_datasets(self, dataset_names, search_type):
+		params, field = self.client._dataset_search_params(dataset_names, search_type)
+		r = await self._request('GET', '/services/data/v54.0/wave/datasets', params=params)
+		if r.ok == False:
+			logging.debug(r.text)
+			return [(n, None) for n in dataset_names]
+		datasets = r.json()['datasets']
+
+		results = []
+		for n in dataset_names:
+			matches = [d for d in datasets if d.get(field) == n]
+			if len(matches) == 0:
+				results.append((n, None))
+				continue
+			dsvid = matches[0].get('currentVersionId')
+			if dsvid is None:
+				dsvid = (await self._get_json('/services/data/v46.0/wave/datasets/'+matches[0]['id']))['currentVersionId']
+			results.append((n, self.client._store_dataset((self.env_url, search_type, n), matches[0]['name'], matches[0]['id'], dsvid)))
+		return results
+
+
+	async def run_saql_query(self, saql, dataset_search_type='API Name', search_for_dataset=True, save_path=None, use_cache=True, verbose=False):
+		if verbose == True:
+			start = time.time()
+			print('Checking SAQL and Finding Dataset IDs...')
+
+		saql_query = saql
+		if search_for_dataset == True:
+			saql_query = await self._resolve_saql(saql, dataset_search_type=dataset_search_type, use_cache=use_cache)
+
+		if verbose == True:
+			print('Running SAQL Query...')
+			print(saql_query)
+
+		cache_key, df = self.client._cached_query(saql_query, use_cache)
+		if df is not None and search_for_dataset == True and await self._has_new_versions(saql_query) == True:
+			saql_query = await self._resolve_saql(saql, dataset_search_type=dataset_search_type, use_cache=False)
+			cache_key, df = self.client._cached_query(saql_query, use_cache)
+		if df is None:
+			try:
+				records = await self._post_saql(saql_query)
+			except EinsteinAnalyticsError as e:
+				if search_for_dataset == False:
+					raise
+				#a dataset may have published a new version since its ID was cached so look the datasets up again
+				logging.debug(e)
+				saql_query = await self._resolve_saql(saql, dataset_search_type=dataset_search_type, use_cache=False)
+				records = await self._post_saql(saql_query)
+				if cache_key is not None:
+					cache_key = self.client._query_cache_key(saql_query)
+			df = self.client._cache_query_result(cache_key, saql_query, records)
+
+		if save_path is not None:
+			df.to_csv(save_path, index=False)
+		if verbose == True:
+			print('Completed in '+str(round(time.time()-start,3))+'sec')
+		return df
+
+
+	async def _has_new_versions(self, saql_query):
+		'''
+			Same check as the synchronous _has_new_versions, with the loaded dataset IDs looked up in one batched search.
+		'''
+		versions = self.client.query_cache.versions(saql_query)
+		try:
+			current = {dsid: ds[2] for dsid, ds in await self._lookup_datasets(list(versions), 'ID') if ds is not None}
+		except Exception as e:
+			logging.debug('Could not check dataset versions: {}'.format(e))
+			return False
+		return self.client._versions_changed(saql_query, current)
+
+
+	async def _resolve_saql(self, saql, dataset_search_type='API Name', use_cache=True):
+		dataset_names = self.client._find_load_datasets(saql)
+		resolved = await self.resolve_datasets(dataset_names, search_type=dataset_search_type, use_cache=use_cache)
+		missing = [n for n in dataset_names if n not in resolved]
+		if len(missing) > 0:
+			raise EinsteinAnalyticsError('Dataset search for {} failed to return a result.  Ensure you have access to the dataset and review the Troubleshooting section in the documentation'.format(', '.join(missing)))
+		return self.client._rewrite_saql(saql, resolved)
+
+
+	async def _post_saql(self, saql_query):
+		r = await self._request('POST', '/services/data/v46.0/wave/query', data=json.dumps({"query":saql_query}))
+		try:
+			return r.json()['results']['records']
+		except (ValueError, KeyError, TypeError):
+			raise EinsteinAnalyticsError('SAQL query failed ('+str(r.status_code)+'): '+r.text)
+
+
+	async def getMetaData(self, appIdList, objectList=['dashboards','lenses','datasets'], verbose=False):
+		pairs = [(a, obj) for a in appIdList for obj in objectList]
+		pages = await self._gather([self._list_assets(a, obj) for a, obj in pairs], pairs, error_message='Could not get {0[1]} for app {0[0]}')
+		if verbose == True:
+			print('Collected metadata for '+str(len(appIdList))+' apps.')
+		return self.client._parse_asset_dates(json_normalize([r for p in pages if p is not None for r in p]))
+
+
+	async def _list_assets(self, app_id, obj):
+		params = {'pageSize': 200, 'sort': 'Mru', 'hasCurrentOnly': 'true', 'folderId': app_id}
+		response = await self._get_json('/services/data/v46.0/wave/'+obj, params=params)
+		records = response[obj]
+		next_page = response.get('nextPageUrl')
+		while next_page is not None:
+			response = await self._get_json(next_page)
+			records.extend(response[obj])
+			next_page = response.get('nextPageUrl')
+		return records
+
+
+	async def get_app_user_list(self, app_id=None, save_path=None, verbose=False):
+		if app_id is None:
+			folders = []
+			response = await self._get_json('/services/data/v46.0/wave/folders')
+			folders.extend(response['folders'])
+			next_page = response.get('nextPageUrl')
+			while next_page is not None:
+				response = await self._get_json(next_page)
+				folders.extend(response['folders'])
+				next_page = response.get('nextPageUrl')
+			app_id = [f['id'] for f in folders]
+		elif type(app_id) is not list and type(app_id) is not tuple:
+			raise EinsteinAnalyticsError('Please input a list or tuple of app Ids')
+
+		async def shares(app):
+			response = await self._get_json('/services/data/v46.0/wave/folders/'+app)
+			return self.client._share_rows(app, response['label'], response['shares'])
+
+		app_rows = await self._gather([shares(a) for a in app_id], app_id, error_message='Could not get access details for app {}')
+		rows = [row for r in app_rows if r is not None for row in r]
+		app_user_df = pd.DataFrame(rows, columns=['AppId', 'AppName', 'UserId', 'UserName', 'AccessType', 'UserType'])
+		if verbose == True:
+			print('Collected access details for '+str(len(app_id))+' apps.')
+		if save_path is not None:
+			app_user_df.to_csv(save_path, index=False)
+		return app_user_df
+
+
+	async def load_df_to_EA(self, df, dataset_api_name, xmd=None, encoding='UTF-8', operation='Overwrite', useNumericDefaults=True, default_measure_val="0.0",
+		default_measure_fmt="0.0#", charset="UTF-8", deliminator=",", lineterminator="\r\n", removeNONascii=True, ascii_columns=None, fillna=True, dataset_label=None, compress=False, xmd_sample_size=None, verbose=False):
+		'''
+			Returns an UploadJob with the prep, encode and upload timings (await job.wait() or wait_for_completion to follow the
+			processing).  Data preparation and encoding run in the default executor so the event loop is not blocked.
+		'''
+		loop = asyncio.get_running_loop()
+		job = UploadJob(self)
+		prep_start = time.perf_counter()
+		dataset_api_name, upload_config, df = await loop.run_in_executor(None, lambda: self.client._prepare_upload(df, dataset_api_name, xmd=xmd, encoding=encoding,
+			operation=operation, useNumericDefaults=useNumericDefaults, default_measure_val=default_measure_val, default_measure_fmt=default_measure_fmt,
+			charset=charset, deliminator=deliminator, lineterminator=lineterminator, removeNONascii=removeNONascii, ascii_columns=ascii_columns, fillna=fillna,
+			xmd_sample_size=xmd_sample_size))
+		job.add_time('prep', time.perf_counter() - prep_start)
+
+		r1 = await self._request('POST', '/services/data/v46.0/sobjects/InsightsExternalData', data=json.dumps(upload_config))
+		try:
+			job.job_id = r1.json()['id']
+		except (ValueError, KeyError, TypeError):
+			raise EinsteinAnalyticsError('Upload Config Failed: '+r1.text)
+
+		parts = self.client._iter_data_parts(df, compress=compress, job=job, verbose=verbose)
+		while True:
+			data_part64 = await loop.run_in_executor(None, next, parts, None)
+			if data_part64 is None:
+				break
+			job.parts += 1
+			payload = {
+				"InsightsExternalDataId" : job.job_id,
+				"PartNumber" : str(job.parts),
+				"DataFile" : data_part64
+			}
+			upload_start = time.perf_counter()
+			r2 = await self._request('POST', '/services/data/v46.0/sobjects/InsightsExternalDataPart', data=json.dumps(payload))
+			job.add_time('upload', time.perf_counter() - upload_start)
+			if r2.ok == False:
+				raise EinsteinAnalyticsError('Datapart Upload Failed: '+r2.text)
+
+		r3 = await self._request('PATCH', '/services/data/v46.0/sobjects/InsightsExternalData/'+job.job_id, data=json.dumps({"Action" : "Process"}))
+		if r3.ok == False:
+			raise EinsteinAnalyticsError('Process request failed: '+r3.text)
+		job.processing_started = time.perf_counter()
+		if verbose == True:
+			print('\nData Upload Process Started. Check Progress in Data Monitor or await wait_for_completion.')
+			print('Job ID: '+str(job.job_id))
+			print(self.client._format_timings(job))
+		return job
+
+
+	async def wait_for_completion(self, job_id, timeout=3600, poll_interval=2, poll_backoff=1.5, max_poll_interval=60, verbose=False):
+		'''
+			Same as the synchronous wait_for_completion, but sleeps without blocking the event loop.  job_id can be an ID or the
+			UploadJob returned by load_df_to_EA.
+		'''
+		job = job_id if isinstance(job_id, UploadJob) else None
+		if job is not None:
+			job_id = job.job_id
+
+		start = time.perf_counter()
+		interval = poll_interval
+		record = None
+		last_status = None
+		while True:
+			await asyncio.sleep(max(min(interval, timeout - (time.perf_counter() - start)), 0))
+			r = await self._request('GET', '/services/data/v46.0/sobjects/InsightsExternalData/'+job_id, params={'fields': 'Status,StatusMessage'})
+			if r.ok == True:
+				record = r.json()
+				if verbose == True and record.get('Status') != last_status:
+					print('Job '+job_id+': '+str(record.get('Status'))+' ('+str(round(time.perf_counter()-start,1))+'sec)')
+				last_status = record.get('Status')
+				if last_status in self.client._JOB_DONE_STATUSES:
+					break
+			else:
+				logging.debug(r.text)
+
+			if time.perf_counter() - start >= timeout:
+				logging.warning(' Job '+job_id+' had not finished after '+str(timeout)+'sec')
+				break
+			interval = min(interval * poll_backoff, max_poll_interval)
+
+		if job is not None:
+			job.status = last_status
+			if last_status in self.client._JOB_DONE_STATUSES:
+				job.timings['processing'] = time.perf_counter() - (job.processing_started or start)
+		if last_status in ('Failed', 'NotProcessed'):
+			logging.warning(' Job '+job_id+' '+last_status+': '+str(record.get('StatusMessage')))
+		if verbose == True and job is not None:
+			print(self.client._format_timings(job))
+		return record
+
+
+	async def addArchivePrefix(self, warnList, prefix='[ARCHIVE] ', removePrefix=False, verbose=False):
+		'''
+			Same as the synchronous addArchivePrefix: asset types are resolved up front (see _asset_frame), each label is
+			PATCHed on the endpoint of its type and a dataframe with the result for each asset is returned.
+		'''
+		loop = asyncio.get_running_loop()
+		assets = await loop.run_in_executor(None, lambda: self.client._asset_frame(warnList, need_label=True))
+
+		async def relabel(asset):
+			currentLabel = asset['label']
+			if currentLabel is None:
+				r = await self._request('GET', '/services/data/v46.0/wave/'+asset['type']+'/'+asset['id'])
+				if r.ok == False:
+					return {'status': 'error', 'message': r.text}
+				currentLabel = r.json()['label']
+			newLabel = self.client._prefixed_label(currentLabel, prefix, removePrefix)
+			if newLabel is None:
+				return {'old_label': currentLabel, 'status': 'skipped', 'message': 'label does not start with the prefix'}
+			r = await self._request('PATCH', '/services/data/v46.0/wave/'+asset['type']+'/'+asset['id'], data=json.dumps({'label': newLabel}))
+			if r.ok == False or r.json().get('label') != newLabel:
+				return {'old_label': currentLabel, 'status': 'error', 'message': r.text}
+			logging.debug('Successfully updated asset name for: '+asset['id'])
+			return {'old_label': currentLabel, 'new_label': newLabel, 'status': 'success'}
+
+		return await self._update_assets(assets, relabel, ['id', 'type', 'old_label', 'new_label', 'status', 'message', 'latency'], verbose=verbose)
+
+
+	async def archiveAssets(self, archiveAppId, ToMoveList, verbose=False):
+		'''
+			Same as the synchronous archiveAssets: asset types are resolved up front (see _asset_frame), each asset is
+			PATCHed on the endpoint of its type and a dataframe with the result for each asset is returned.
+		'''
+		loop = asyncio.get_running_loop()
+		assets = await loop.run_in_executor(None, lambda: self.client._asset_frame(ToMoveList))
+		payload = json.dumps({'folder': {'id':archiveAppId} })
+
+		async def move(asset):
+			if asset['folder'] == archiveAppId:
+				return {'old_folder': asset['folder'], 'new_folder': archiveAppId, 'status': 'skipped', 'message': 'already in the archive app'}
+			r = await self._request('PATCH', '/services/data/v46.0/wave/'+asset['type']+'/'+asset['id'], data=payload)
+			if r.ok == False or (r.json().get('folder') or {}).get('id') != archiveAppId: #check to ensure response has new folder id
+				return {'old_folder': asset['folder'], 'status': 'error', 'message': r.text}
+			logging.debug('Successfully archived (type='+asset['type']+'): '+asset['id'])
+			return {'old_folder': asset['folder'], 'new_folder': archiveAppId, 'status': 'success'}
+
+		return await self._update_assets(assets, move, ['id', 'type', 'old_folder', 'new_folder', 'status', 'message', 'latency'], verbose=verbose)
+
+
+	async def _update_assets(self, assets, update, columns, verbose=False):
+		'''
+			Awaits update(asset) for every asset at once and returns the results in the format of the synchronous _update_assets.
+		'''
+		async def run(asset):
+			if asset['type'] is None:
+				return {'status': 'error', 'message': 'asset was not found as a dashboard or lens', 'latency': 0.0}
+			t = time.perf_counter()
+			try:
+				result = await update(asset)
+			except Exception as e:
+				result = {'status': 'error', 'message': str(e)}
+			result['latency'] = time.perf_counter() - t
+			return result
+
+		rows = []
+		for asset, result in zip(assets, await asyncio.gather(*[run(a) for a in assets])):
+			rows.append(dict(result, id=asset['id'], type=asset['type']))
+			if result['status'] == 'error':
+				logging.warning(' could not update asset '+str(asset['id'])+': '+str(result.get('message')))
+		results = pd.DataFrame(rows, columns=columns)
+		if verbose == True:
+			print(str((results['status'] == 'success').sum())+' updated, '+str((results['status'] == 'skipped').sum())+' skipped, '+
+				str((results['status'] == 'error').sum())+' failed')
+		return results
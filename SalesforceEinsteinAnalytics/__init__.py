@@ -1,2 +1,3 @@
-from SalesforceEinsteinAnalytics.SFDC_EA import salesforceEinsteinAnalytics
+from SalesforceEinsteinAnalytics.SFDC_EA import salesforceEinsteinAnalytics, EinsteinAnalyticsError, UploadJob, LineageIndex, MetadataStore, DashboardBackupStore
+from SalesforceEinsteinAnalytics.SFDC_EA_async import salesforceEinsteinAnalyticsAsync
 __version__ = '1.2'
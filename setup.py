@@ -30,6 +30,10 @@ setup(
         "Operating System :: OS Independent",
     ],
     install_requires=requirements,
+    extras_require={
+        'parquet': ['pyarrow'],
+        'async': ['aiohttp'],
+    },
     license='MIT',
     python_requires='>=3.6',
 )
@@ -0,0 +1,75 @@
+import base64
+import gzip
+import io
+import json
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import pandas as pd
+import pytest
+
+from SalesforceEinsteinAnalytics import SFDC_EA
+from SalesforceEinsteinAnalytics import salesforceEinsteinAnalytics
+
+
+class _ExternalDataHandler(BaseHTTPRequestHandler):
+	'''
+		Stand-in for the InsightsExternalData endpoints.  Data parts are kept on the server by part number.
+	'''
+	protocol_version = 'HTTP/1.1'
+
+	def log_message(self, *args):
+		pass
+
+	def _reply(self, obj):
+		data = json.dumps(obj).encode('utf-8')
+		self.send_response(200)
+		self.send_header('Content-Type', 'application/json')
+		self.send_header('Content-Length', str(len(data)))
+		self.end_headers()
+		self.wfile.write(data)
+
+	def do_POST(self):
+		body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+		if self.path.endswith('/InsightsExternalDataPart'):
+			assert body['InsightsExternalDataId'] == '06V000000000001'
+			with self.server.lock:
+				self.server.parts[int(body['PartNumber'])] = body['DataFile']
+		self._reply({'id': '06V000000000001', 'success': True})
+
+	def do_PATCH(self):
+		self.server.processed = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+		self._reply({})
+
+
+@pytest.fixture
+def server():
+	srv = ThreadingHTTPServer(('127.0.0.1', 0), _ExternalDataHandler)
+	srv.parts = {}
+	srv.lock = threading.Lock()
+	srv.processed = None
+	threading.Thread(target=srv.serve_forever, daemon=True).start()
+	yield srv
+	srv.shutdown()
+
+
+@pytest.mark.parametrize('max_workers', [1, 4])
+def test_compressed_parts_reassemble_to_source(server, monkeypatch, max_workers):
+	#small parts so that the frame is split across many of them
+	monkeypatch.setattr(SFDC_EA, '_MAX_PART_SIZE', 20000)
+	df = pd.DataFrame({
+		'id': range(5000),
+		'name': ['name, "quoted" '+str(i % 97) for i in range(5000)],
+		'amount': [i * 0.25 for i in range(5000)]
+	})
+	EA = salesforceEinsteinAnalytics('http://127.0.0.1:'+str(server.server_address[1]), 'chrome', rawcookie='token')
+
+	job = EA.load_df_to_EA(df, 'test_dataset', removeNONascii=False, fillna=False, max_workers=max_workers, compress=True)
+
+	assert server.processed == {'Action': 'Process'}
+	assert sorted(server.parts) == list(range(1, job.parts + 1))
+	assert job.parts > 1
+	parts = [base64.b64decode(server.parts[n]) for n in sorted(server.parts)]
+	assert all(len(server.parts[n]) <= SFDC_EA._MAX_PART_SIZE for n in server.parts)
+	csv = b''.join(gzip.decompress(p) for p in parts)
+	pd.testing.assert_frame_equal(pd.read_csv(io.BytesIO(csv)), df, check_dtype=False)